@@ -0,0 +1,209 @@
+import argparse
+import warnings
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# Speed methods in the results store and their column
+METHOD_COLUMNS = {
+    'IR timing gates': 'reference_speed',
+    'Differential': 'mean_speed',
+    'Distance-based': 'dist_speed'
+}
+# Statistics computed for every method pair; all of them get a bootstrap confidence interval
+STATISTICS = ('bias', 'sd', 'loa_lower', 'loa_upper', 'slope', 'intercept', 'icc')
+
+
+def agreement_stats(data1, data2, mask=None):
+    """
+    Agreement statistics of two methods, for any number of method pairs at once.
+
+    The last axis holds the paired measurements; all leading axes are treated
+    as independent pairs/groups, so a whole batch of groups (padded to the same
+    length) is computed in one pass.
+
+    Parameters:
+    - data1: Measurements of the first method, shape (..., n).
+    - data2: Measurements of the second method, shape (..., n).
+    - mask: Boolean array, True for the measurements to use (default: all finite pairs).
+
+    Returns a dictionary of arrays with shape (...):
+    - n: Number of paired measurements.
+    - bias: Mean difference (data1 - data2).
+    - sd: Standard deviation of the differences (n - 1 degrees of freedom).
+    - loa_lower / loa_upper: Limits of agreement, bias -/+ 1.96 SD.
+    - slope / intercept: Proportional bias, regression of the difference on the mean of both methods.
+    - icc: Intraclass correlation ICC(2,1), two-way random effects, absolute agreement.
+    """
+    data1 = np.asarray(data1, dtype=np.float64)
+    data2 = np.asarray(data2, dtype=np.float64)
+    if mask is None:
+        mask = np.isfinite(data1) & np.isfinite(data2)
+    # Zero the unused measurements so that masked sums can be used instead of nan-functions
+    x = np.where(mask, data1, 0.0)
+    y = np.where(mask, data2, 0.0)
+    n = mask.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        diff = x - y
+        mean = (x + y) / 2
+        bias = diff.sum(axis=-1) / n
+        diff_centered = np.where(mask, diff - bias[..., None], 0.0)
+        sd = np.sqrt((diff_centered ** 2).sum(axis=-1) / (n - 1))
+        sd = np.where(n > 1, sd, np.nan)
+
+        # Proportional bias: least squares fit of diff = intercept + slope * mean
+        mean_of_means = mean.sum(axis=-1) / n
+        mean_centered = np.where(mask, mean - mean_of_means[..., None], 0.0)
+        slope = (mean_centered * diff_centered).sum(axis=-1) / (mean_centered ** 2).sum(axis=-1)
+        intercept = bias - slope * mean_of_means
+
+        # ICC(2,1) from the two-way ANOVA of n trials x 2 methods
+        grand_mean = mean_of_means
+        ss_rows = 2 * (mean_centered ** 2).sum(axis=-1)
+        ss_columns = n * ((x.sum(axis=-1) / n - grand_mean) ** 2 + (y.sum(axis=-1) / n - grand_mean) ** 2)
+        ss_total = (np.where(mask, x - grand_mean[..., None], 0.0) ** 2
+                    + np.where(mask, y - grand_mean[..., None], 0.0) ** 2).sum(axis=-1)
+        ms_rows = ss_rows / (n - 1)
+        ms_columns = ss_columns
+        ms_error = (ss_total - ss_rows - ss_columns) / (n - 1)
+        icc = (ms_rows - ms_error) / (ms_rows + ms_error + 2 * (ms_columns - ms_error) / n)
+
+    return {
+        'n': n,
+        'bias': bias,
+        'sd': sd,
+        'loa_lower': bias - 1.96 * sd,
+        'loa_upper': bias + 1.96 * sd,
+        'slope': slope,
+        'intercept': intercept,
+        'icc': icc
+    }
+
+
+def bootstrap_ci(data1, data2, n, n_boot=2000, ci=95, seed=0, max_elements=2 ** 22):
+    """
+    Percentile bootstrap confidence intervals of the agreement statistics.
+
+    All pairs/groups and resamples are computed as one array of shape
+    (n_pairs, n_boot, length); pairs are processed in chunks of at most
+    max_elements values to bound the memory use.
+
+    Parameters:
+    - data1, data2: Padded measurements of shape (n_pairs, length); only the first n[i] values of row i are used.
+    - n: Number of measurements of every pair, shape (n_pairs,).
+    - n_boot: Number of bootstrap resamples.
+    - ci: Confidence level in percent.
+    - seed: Seed of the random generator, for reproducible intervals.
+
+    Returns a dictionary with (low, high) arrays of shape (n_pairs,) for every statistic in STATISTICS.
+    """
+    n_pairs, length = data1.shape
+    rng = np.random.default_rng(seed)
+    alpha = (100 - ci) / 2
+    intervals = {name: (np.full(n_pairs, np.nan), np.full(n_pairs, np.nan)) for name in STATISTICS}
+    chunk_size = max(1, max_elements // max(1, n_boot * length))
+    positions = np.arange(length)
+
+    for start in range(0, n_pairs, chunk_size):
+        stop = min(start + chunk_size, n_pairs)
+        chunk_n = n[start:stop, None, None]
+        # Resample every pair with replacement from its own n measurements
+        indices = (rng.random((stop - start, n_boot, length)) * chunk_n).astype(np.intp)
+        mask = np.broadcast_to(positions < chunk_n, indices.shape)
+        resampled1 = np.take_along_axis(data1[start:stop, None, :], indices, axis=2)
+        resampled2 = np.take_along_axis(data2[start:stop, None, :], indices, axis=2)
+        stats = agreement_stats(resampled1, resampled2, mask)
+        for name in STATISTICS:
+            values = stats[name]
+            # Degenerate resamples (e.g., all values identical) give NaN and are ignored
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                low, high = np.nanpercentile(values, [alpha, 100 - alpha], axis=1)
+            intervals[name][0][start:stop] = low
+            intervals[name][1][start:stop] = high
+
+    return intervals
+
+
+def agreement_table(df, methods=METHOD_COLUMNS, group_by=('subject', 'condition'), n_boot=2000, ci=95, seed=0):
+    """
+    Agreement statistics of every pair of methods, per group.
+
+    All method pairs and groups are padded into one array and computed in a
+    single batched pass, including the bootstrap confidence intervals.
+
+    Parameters:
+    - df: Results with one row per trial (e.g., ResultStore.read()).
+    - methods: Dictionary of method names and their column in df.
+    - group_by: Columns to group the trials by (() pools all trials).
+    - n_boot: Number of bootstrap resamples (0 skips the confidence intervals).
+    - ci: Confidence level of the intervals in percent.
+    - seed: Seed of the bootstrap, for reproducible intervals.
+
+    Returns a DataFrame with one row per group and method pair, with the
+    columns of agreement_stats and <statistic>_ci_low / <statistic>_ci_high.
+    """
+    group_by = list(group_by)
+    groups = df.groupby(group_by, sort=True) if group_by else [((), df)]
+
+    keys = []
+    samples = []
+    for group, group_df in groups:
+        group = group if isinstance(group, tuple) else (group,)
+        for method_1, method_2 in combinations(methods, 2):
+            paired = group_df[[methods[method_1], methods[method_2]]].dropna().to_numpy(dtype=np.float64)
+            keys.append(group + (method_1, method_2))
+            samples.append(paired)
+
+    columns = group_by + ['method_1', 'method_2']
+    if not samples:
+        return pd.DataFrame(columns=columns + ['n'] + list(STATISTICS))
+
+    # Pad all pairs to the same length
+    n = np.array([len(sample) for sample in samples])
+    length = max(1, n.max())
+    data1 = np.zeros((len(samples), length))
+    data2 = np.zeros((len(samples), length))
+    for i, sample in enumerate(samples):
+        data1[i, :n[i]] = sample[:, 0]
+        data2[i, :n[i]] = sample[:, 1]
+    mask = np.arange(length) < n[:, None]
+
+    stats = agreement_stats(data1, data2, mask)
+    table = pd.DataFrame(keys, columns=columns)
+    for name, values in stats.items():
+        table[name] = values
+    if n_boot > 0:
+        intervals = bootstrap_ci(data1, data2, n, n_boot, ci, seed)
+        for name in STATISTICS:
+            table[f'{name}_ci_low'], table[f'{name}_ci_high'] = intervals[name]
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Agreement statistics of the speed methods in the results store.")
+    parser.add_argument('store', help="Path of the results store (results.sqlite in the output folder)")
+    parser.add_argument('--group-by', nargs='*', default=['subject', 'condition'], help="Columns to group the trials by (none pools all trials)")
+    parser.add_argument('--n-boot', type=int, default=2000, help="Number of bootstrap resamples")
+    parser.add_argument('--ci', type=float, default=95, help="Confidence level in percent")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the bootstrap")
+    parser.add_argument('--output', help="Save the table to this CSV or Excel file")
+    args = parser.parse_args()
+
+    from result_store import ResultStore
+    store = ResultStore(args.store)
+    results = store.read()
+    store.close()
+
+    table = agreement_table(results, group_by=args.group_by, n_boot=args.n_boot, ci=args.ci, seed=args.seed)
+    if args.output is None:
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(table)
+    elif args.output.lower().endswith('.csv'):
+        table.to_csv(args.output, index=False)
+        print(f"Agreement statistics saved to {args.output}")
+    else:
+        table.to_excel(args.output, index=False)
+        print(f"Agreement statistics saved to {args.output}")
@@ -0,0 +1,119 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def find_trial_files(root, extension='.tsv', recursive=True):
+    """
+    List the trial files below a folder in a stable (sorted) order.
+
+    Parameters:
+    - root: Folder to search, e.g. a subject/condition tree such as Data/tracked_data.
+    - extension: File extension of the trials, or a tuple of extensions.
+    - recursive: Set to True to also search all subfolders.
+
+    Returns a sorted list of file paths.
+    """
+    if not recursive:
+        return sorted(
+            os.path.join(root, name) for name in os.listdir(root)
+            if name.endswith(extension) and os.path.isfile(os.path.join(root, name))
+        )
+
+    file_paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        file_paths.extend(os.path.join(dirpath, name) for name in filenames if name.endswith(extension))
+    return sorted(file_paths)
+
+
+def _glob_root(pattern):
+    # Leading folders of a pattern without wildcards, e.g. data for data/*/*.tsv
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            return os.sep.join(parts) or os.curdir
+        parts.append(part)
+    return os.path.dirname(os.sep.join(parts)) or os.curdir
+
+
+def glob_trial_files(patterns):
+    """
+    List the trial files matching glob patterns in a stable (sorted) order.
+
+    Parameters:
+    - patterns: Glob pattern or list of patterns, e.g. 'Data/**/*.tsv' ('**' matches any number of subfolders).
+
+    Returns:
+    - root: Common folder of the patterns (up to their first wildcard), used to mirror the subfolders in the output.
+    - file_paths: Sorted list of matching file paths, without duplicates.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    file_paths = sorted({
+        os.path.normpath(path) for pattern in patterns
+        for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)
+    })
+    root = os.path.commonpath([os.path.abspath(_glob_root(pattern)) for pattern in patterns]) if patterns else os.curdir
+    return root, file_paths
+
+
+def _describe(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def run_batch(worker, tasks, max_workers=None, on_result=None):
+    """
+    Run worker(*task) for every task, fanned out over a process pool.
+
+    Results are returned in the order of tasks regardless of which worker
+    finishes first, so the output is deterministic. A failing task is
+    reported and does not abort the batch.
+
+    Parameters:
+    - worker: Top-level (picklable) function processing a single file.
+    - tasks: List of argument tuples; the first argument is the file path.
+    - max_workers: Number of worker processes (default: number of CPUs).
+      Use 1 to process the files one after another in this process; a single
+      task is always processed in this process, without starting a pool.
+    - on_result: Optional function called as on_result(index, result) in this
+      process for every successful task, as soon as it finishes (in order of
+      completion, e.g., to save the result before the rest of the batch finishes).
+
+    Returns:
+    - results: List with one entry per task (None for failed tasks).
+    - failures: List of (file_path, message) tuples for failed tasks.
+    """
+    results = [None] * len(tasks)
+    failures = []
+
+    if max_workers == 1 or len(tasks) <= 1:
+        for i, task in enumerate(tasks):
+            try:
+                results[i] = worker(*task)
+            except Exception as e:
+                failures.append((task[0], _describe(e)))
+                continue
+            if results[i] is None:
+                failures.append((task[0], "No result returned."))
+            elif on_result is not None:
+                on_result(i, results[i])
+        return results, failures
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, *task): i for i, task in enumerate(tasks)}
+        # Collect the results as the tasks finish, so on_result is not held back by a slow task
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                failures.append((i, tasks[i][0], _describe(e)))
+                continue
+            if results[i] is None:
+                failures.append((i, tasks[i][0], "No result returned."))
+            elif on_result is not None:
+                on_result(i, results[i])
+
+    # Report the failures in the order of tasks
+    return results, [(file_path, message) for _, file_path, message in sorted(failures)]
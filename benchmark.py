@@ -0,0 +1,355 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+import main
+from batch_runner import find_trial_files
+from instrumentation import TrialMetrics
+from qtm_reader import read_qtm_header
+from trial_cache import get_readers
+
+PACKAGE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DATA_FOLDER = os.path.join(PACKAGE_FOLDER, 'QTM_data_HFIMV9053')
+REFERENCE_EXCEL = os.path.join(PACKAGE_FOLDER, 'results', 'speed_comparison_tracked_data.xlsx')
+REFERENCE_FOLDER = os.path.join(DATA_FOLDER, 'Data', 'tracked_data')
+BASELINE_PATH = os.path.join(PACKAGE_FOLDER, 'benchmark_baseline.json')
+
+# Stages of main.process_trial run for every trial (as in metrics.jsonl), then once per batch
+TRIAL_STAGES = ('read', 'gap_fill', 'midpoint', 'v_t_g', 'v_t_g_dist', 'savefig', 'plot_3d')
+BATCH_STAGES = ('excel', 'bland_altman')
+# Condition sections of speed_comparison_tracked_data.xlsx and their folder
+REFERENCE_SECTIONS = {'fixed speed': 'fixed_speed', 'Preffered speed': 'pref_speed'}
+
+
+class StageRecorder:
+    """
+    Collects the latency and (optionally) the peak traced memory of every stage.
+    """
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.times = defaultdict(list)
+        self.peaks = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name].append(time.perf_counter() - start)
+            if self.track_memory:
+                self.peaks[name] = max(self.peaks[name], tracemalloc.get_traced_memory()[1] - start_memory)
+
+
+class RecorderMetrics(TrialMetrics):
+    """
+    TrialMetrics that times the stages of main.process_trial in a StageRecorder.
+    """
+
+    def __init__(self, file_path, recorder):
+        super().__init__(file_path)
+        self.recorder = recorder
+
+    @contextmanager
+    def timer(self, stage):
+        with self.recorder.stage(stage):
+            yield
+
+
+def default_params():
+    """
+    Return the processing parameters of the settings in main.py, without figures, metrics files or extra CSV files.
+    """
+    settings = {name: getattr(main, name) for name in main.SETTINGS}
+    settings.update(plot_figure=0, render_plots='off', save_speed_profiles=False, segment_passes=False, metrics=False, profile=None)
+    return main.build_params(settings)
+
+
+def run_trial(file_path, params, recorder, output_folder=None):
+    """
+    Process one trial with main.process_trial, recording the time of every stage.
+
+    The trial cache is cleared first, so every run parses the file. Plots
+    are only saved if output_folder is set.
+
+    Returns the result row; raises RuntimeError if the trial cannot be processed.
+    """
+    params = dict(params, render_plots='off' if output_folder is None else 'inline')
+    main.get_trial_cache(params).clear()
+    metrics = RecorderMetrics(file_path, recorder)
+    # The progress messages of process_trial would hide the benchmark tables
+    with redirect_stdout(io.StringIO()):
+        result = main.process_trial(file_path, output_folder, params, metrics)
+    if result is None:
+        raise RuntimeError('; '.join(metrics.errors))
+    return result
+
+
+def run_dataset(file_paths, params, recorder, output_folder=None):
+    """
+    Run all stages over a list of trials.
+
+    Returns the result rows (by file path), the failures and the wall time of the trial stages.
+    """
+    results = {}
+    failures = []
+    start = time.perf_counter()
+    for file_path in file_paths:
+        try:
+            results[file_path] = run_trial(file_path, params, recorder, output_folder)
+        except Exception as e:
+            failures.append((file_path, f"{type(e).__name__}: {e}"))
+    trial_time = time.perf_counter() - start
+
+    if output_folder is not None and results:
+        rows = [main.add_bounds(result, params) for result in results.values()]
+        with recorder.stage('excel'):
+            pd.DataFrame(rows).to_excel(os.path.join(output_folder, 'speed_comparison.xlsx'), index=False)
+        from vtg_render import get_pyplot
+        get_pyplot(0)
+        from bland_altman_plots import bland_altman_plot
+        speeds = pd.DataFrame(rows)
+        with recorder.stage('bland_altman'):
+            bland_altman_plot(
+                speeds['Mean Speed (m/s)'].to_numpy(),
+                speeds['Distance-Based Speed (m/s)'].to_numpy(),
+                title="Differential vs Distance-Based Speed",
+                save_path=os.path.join(output_folder, 'bland_altman.png')
+            )
+    return results, failures, trial_time
+
+
+def write_synthetic_tsv(file_path, template_path, duration, fs, speed=4.0, seed=0):
+    """
+    Write a synthetic QTM TSV export of a subject running back and forth through the gates.
+
+    The markers of template_path are placed at their offsets from the SIPS
+    midpoint in its first complete frame, so the file has the same columns as
+    a real capture, scaled to duration seconds at fs Hz.
+    """
+    header, data = get_readers(template_path)[1](template_path)
+    marker_names = header['MARKER_NAMES']
+    complete = np.flatnonzero(np.all(data != 0, axis=(1, 2)))
+    frame = data[complete[0]] if len(complete) else data[0]
+    sips = [marker_names.index('SIPS_left'), marker_names.index('SIPS_right')]
+    offsets = frame - frame[sips].mean(axis=0)
+
+    # Midpoint running between y = -3 m and y = 4 m at a constant speed, with some sway
+    n_frames = int(duration * fs)
+    t = np.arange(n_frames) / fs
+    rng = np.random.default_rng(seed)
+    lap = 7.0 / speed
+    phase = (t % (2 * lap)) / lap
+    y = np.where(phase < 1, 4.0 - 7.0 * phase, -3.0 + 7.0 * (phase - 1))
+    midpoint = np.column_stack((0.9 + 0.02 * np.sin(2 * np.pi * 1.4 * t), y, 0.95 + 0.03 * np.sin(2 * np.pi * 2.8 * t))) * 1000
+    markers = midpoint[:, None, :] + offsets[None, :, :] + rng.normal(0, 0.5, (n_frames, len(marker_names), 3))
+
+    with open(file_path, 'w') as f:
+        f.write(f"NO_OF_FRAMES\t{n_frames}\nNO_OF_CAMERAS\t24\nNO_OF_MARKERS\t{len(marker_names)}\nFREQUENCY\t{fs:g}\n")
+        f.write("NO_OF_ANALOG\t0\nANALOG_FREQUENCY\t0\nDESCRIPTION\t--\nTIME_STAMP\t--\nDATA_INCLUDED\t3D\n")
+        f.write("MARKER_NAMES\t" + "\t".join(marker_names) + "\n")
+        f.write("TRAJECTORY_TYPES\t" + "\t".join(['Measured'] * len(marker_names)) + "\n")
+        f.write("Frame\tTime\t" + "\t".join(f"{name} {axis}" for name in marker_names for axis in 'XYZ') + "\n")
+        table = np.column_stack((np.arange(1, n_frames + 1), t, markers.reshape(n_frames, -1)))
+        np.savetxt(f, table, fmt=['%d', '%.5f'] + ['%.3f'] * (table.shape[1] - 2), delimiter='\t')
+
+
+def load_reference_speeds(excel_path=REFERENCE_EXCEL):
+    """
+    Read the differential and distance-based speeds of speed_comparison_tracked_data.xlsx.
+
+    Returns a dictionary {(subject, condition, trial file): (mean speed, distance-based speed)}.
+    """
+    sheet = pd.read_excel(excel_path, header=None)
+    reference = {}
+    condition = subject = None
+    for row in sheet.itertuples(index=False):
+        label = row[0]
+        if not isinstance(label, str):
+            continue
+        label = label.strip()
+        if label in REFERENCE_SECTIONS:
+            condition = REFERENCE_SECTIONS[label]
+        elif label.startswith('FP'):
+            subject = label
+        elif label.endswith('.tsv') and condition and subject:
+            reference[(subject, condition, label)] = (float(row[2]), float(row[4]))
+    return reference
+
+
+def check_reference(params, tolerance=1e-6):
+    """
+    Compare the speeds of the tracked data with speed_comparison_tracked_data.xlsx.
+
+    Returns a list of mismatch messages (empty if all speeds match).
+    """
+    mismatches = []
+    recorder = StageRecorder()
+    for (subject, condition, filename), expected in sorted(load_reference_speeds().items()):
+        file_path = os.path.join(REFERENCE_FOLDER, subject, condition, filename)
+        try:
+            result = run_trial(file_path, params, recorder)
+        except Exception as e:
+            mismatches.append(f"{subject}/{condition}/{filename}: {type(e).__name__}: {e}")
+            continue
+        computed = (result['Mean Speed (m/s)'], result['Distance-Based Speed (m/s)'])
+        for name, value, reference_value in zip(('mean speed', 'distance-based speed'), computed, expected):
+            if not abs(value - reference_value) <= tolerance:
+                mismatches.append(f"{subject}/{condition}/{filename}: {name} {value:.6f} != {reference_value:.6f}")
+    return mismatches
+
+
+def summarize(recorder, n_files, trial_time):
+    """
+    Return the per-stage summary of a benchmark run as a dictionary.
+    """
+    stages = {}
+    for name in TRIAL_STAGES + BATCH_STAGES:
+        times = recorder.times.get(name)
+        if not times:
+            continue
+        stages[name] = {
+            'calls': len(times),
+            'total_s': float(np.sum(times)),
+            'mean_ms': float(np.mean(times) * 1000),
+            'peak_mib': recorder.peaks.get(name, 0) / 1024 ** 2
+        }
+    return {
+        'files': n_files,
+        'files_per_second': n_files / trial_time if trial_time > 0 else float('nan'),
+        'stages': stages
+    }
+
+
+def print_summary(name, summary, baseline=None, tolerance=0.2):
+    """
+    Print the summary of one dataset; stages slower than the baseline by more than tolerance are flagged.
+
+    Returns the number of flagged stages.
+    """
+    print(f"\n{name}: {summary['files']} files, {summary['files_per_second']:.2f} files/s")
+    print(f"{'stage':<14}{'calls':>7}{'total (s)':>12}{'mean (ms)':>12}{'peak (MiB)':>12}{'baseline (ms)':>15}")
+    regressions = 0
+    baseline_stages = (baseline or {}).get('stages', {})
+    for stage, values in summary['stages'].items():
+        line = f"{stage:<14}{values['calls']:>7}{values['total_s']:>12.3f}{values['mean_ms']:>12.2f}{values['peak_mib']:>12.2f}"
+        if stage in baseline_stages:
+            reference_ms = baseline_stages[stage]['mean_ms']
+            line += f"{reference_ms:>15.2f}"
+            if values['mean_ms'] > reference_ms * (1 + tolerance):
+                line += f"  SLOWER ({values['mean_ms'] / reference_ms:.2f}x)"
+                regressions += 1
+        print(line)
+    # Stages of an older baseline that are not measured any more cannot be checked
+    unchecked = [stage for stage in baseline_stages if stage not in summary['stages']]
+    if unchecked:
+        print(f"Not checked against the baseline: {', '.join(unchecked)} (save a new baseline with --save-baseline)")
+    return regressions
+
+
+def benchmark(file_paths, params, plots=True, repeat=1):
+    """
+    Benchmark the stages over file_paths.
+
+    Latency is the best of repeat runs; the peak memory of every stage is
+    measured in a separate run with tracemalloc, so tracing does not slow
+    down the timed runs.
+    """
+    output_folder = tempfile.mkdtemp(prefix='vtg_benchmark_') if plots else None
+    try:
+        best = None
+        for _ in range(repeat):
+            recorder = StageRecorder()
+            _, failures, trial_time = run_dataset(file_paths, params, recorder, output_folder)
+            summary = summarize(recorder, len(file_paths) - len(failures), trial_time)
+            if best is None or summary['files_per_second'] > best['files_per_second']:
+                best = summary
+
+        memory_recorder = StageRecorder(track_memory=True)
+        tracemalloc.start()
+        try:
+            run_dataset(file_paths, params, memory_recorder, output_folder)
+        finally:
+            tracemalloc.stop()
+        for stage, peak in memory_recorder.peaks.items():
+            if stage in best['stages']:
+                best['stages'][stage]['peak_mib'] = peak / 1024 ** 2
+    finally:
+        if output_folder is not None:
+            shutil.rmtree(output_folder, ignore_errors=True)
+    return best, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the speed pipeline on the bundled QTM data and synthetic captures, "
+                                                 "and check the speeds against speed_comparison_tracked_data.xlsx.")
+    parser.add_argument('--data', default=DATA_FOLDER, help="Folder with the TSV files (searched recursively)")
+    parser.add_argument('--synthetic', nargs='*', default=['60:1000', '300:1000'], metavar='SECONDS:HZ',
+                        help="Synthetic captures to benchmark, as duration:sampling frequency (none to skip)")
+    parser.add_argument('--no-plots', action='store_true', help="Skip the plot, Excel and Bland-Altman stages")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of timed runs; the fastest is reported")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Save this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=20, help="Allowed slowdown against the baseline in percent")
+    args = parser.parse_args()
+
+    params = default_params()
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    # Check the speeds before timing anything
+    mismatches = check_reference(params)
+    print(f"Reference check: {len(load_reference_speeds()) - len(mismatches)} of {len(load_reference_speeds())} trials match "
+          f"{os.path.relpath(REFERENCE_EXCEL, PACKAGE_FOLDER)}")
+    for message in mismatches:
+        print(f"Mismatch: {message}")
+
+    datasets = {'qtm_data': find_trial_files(args.data, '.tsv', recursive=True)}
+    synthetic_folder = tempfile.mkdtemp(prefix='vtg_synthetic_')
+    try:
+        template = os.path.join(REFERENCE_FOLDER, 'FP01', 'pref_speed', 'Running_PREF 5.tsv')
+        for spec in args.synthetic:
+            duration, fs = (float(value) for value in spec.split(':'))
+            file_path = os.path.join(synthetic_folder, f"synthetic_{duration:g}s_{fs:g}Hz.tsv")
+            write_synthetic_tsv(file_path, template, duration, fs)
+            datasets[f"synthetic_{duration:g}s_{fs:g}Hz"] = [file_path]
+
+        regressions = 0
+        summaries = {}
+        for name, file_paths in datasets.items():
+            dataset_params = dict(params)
+            if name.startswith('synthetic'):
+                dataset_params['fs'] = read_qtm_header(file_paths[0])['FREQUENCY']
+            summary, failures = benchmark(file_paths, dataset_params, plots=not args.no_plots, repeat=args.repeat)
+            summaries[name] = summary
+            regressions += print_summary(name, summary, baseline.get(name), args.tolerance / 100)
+            for file_path, message in failures:
+                print(f"Failed: {os.path.relpath(file_path, args.data) if name == 'qtm_data' else file_path}. {message}")
+    finally:
+        shutil.rmtree(synthetic_folder, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(summaries, f, indent=1)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if mismatches or regressions:
+        print(f"\n{len(mismatches)} speed mismatches, {regressions} slower stages.")
+        sys.exit(1)
@@ -1,6 +1,9 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import os
 import numpy as np
+from agreement import agreement_stats
+from result_store import ResultStore
+from vtg_render import get_pyplot
 
 def bland_altman_plot(data1, data2, title, save_path):
     """
@@ -15,15 +18,18 @@ def bland_altman_plot(data1, data2, title, save_path):
     # Calculate the mean and difference between the two methods
     mean = np.mean([data1, data2], axis=0)
     diff = data1 - data2  # Difference between methods
-    mean_diff = np.mean(diff)  # Mean of the differences
-    std_diff = np.std(diff)  # Standard deviation of the differences
+    # Bias and limits of agreement as in agreement.py (SD with n - 1 degrees of freedom)
+    stats = agreement_stats(data1, data2)
+    mean_diff = float(stats['bias'])  # Mean of the differences
+    loa_lower, loa_upper = float(stats['loa_lower']), float(stats['loa_upper'])  # Mean difference -/+ 1.96 SD
 
     # Create the plot
+    plt = get_pyplot()
     plt.figure(figsize=(10, 6))
     plt.scatter(mean, diff, alpha=0.5, label='Differences')
     plt.axhline(mean_diff, color='red', linestyle='--', label=f'Mean Difference: {mean_diff:.2f}')
-    plt.axhline(mean_diff + 1.96 * std_diff, color='blue', linestyle='--', label=f'+1.96 SD: {mean_diff + 1.96 * std_diff:.2f}')
-    plt.axhline(mean_diff - 1.96 * std_diff, color='blue', linestyle='--', label=f'-1.96 SD: {mean_diff - 1.96 * std_diff:.2f}')
+    plt.axhline(loa_upper, color='blue', linestyle='--', label=f'+1.96 SD: {loa_upper:.2f}')
+    plt.axhline(loa_lower, color='blue', linestyle='--', label=f'-1.96 SD: {loa_lower:.2f}')
     plt.title(title)
     plt.ylabel('Difference Between Methods')
     plt.xlabel('measured speed (m/s)')
@@ -36,27 +42,37 @@ def bland_altman_plot(data1, data2, title, save_path):
     plt.close()
     print(f"Bland-Altman plot saved to {save_path}")
 
-# Load the dataset
-# Replace 'your_dataset.xlsx' with the path to your Excel file
-data_path = r'c:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\results\speed_comparison_pref_speed_bland_altman.xlsx'
-df = pd.read_excel(data_path)
-
-# Extract the relevant columns
-ir_timing_gates = df.iloc[:, 0]  # Column A: IR timing gates
-differential_speed = df.iloc[:, 1]  # Column B: Differential-based speed
-distance_speed = df.iloc[:, 2]  # Column C: Distance-based speed
-
-# Create Bland-Altman plots
-bland_altman_plot(
-    ir_timing_gates,
-    differential_speed,
-    title="Fixed speed: IR Timing Gates vs Differential-Based Speed",
-    save_path=r'c:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\results\bland_altman_diff_pref.png'
-)
-
-bland_altman_plot(
-    ir_timing_gates,
-    distance_speed,
-    title="Fixed speed: IR Timing Gates vs Distance-Based Speed",
-    save_path=r'c:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\results\bland_altman_dist_pref.png'
-)
\ No newline at end of file
+if __name__ == '__main__':
+    # Load the results of one condition from the results store written by main.py
+    # (the IR timing gate speeds are imported with: python result_store.py <store> --condition <condition> --prefix tracked_data/ --import-reference <table>)
+    parser = argparse.ArgumentParser(description="Save Bland-Altman plots of the IR timing gate speeds against both speed methods.")
+    parser.add_argument('store', nargs='?', default=os.path.join('results', 'results.sqlite'), help="Path to results.sqlite")
+    parser.add_argument('--condition', default='pref_speed', help="Condition to plot (default: pref_speed)")
+    parser.add_argument('--prefix', help="Only trials whose path starts with this prefix (e.g. tracked_data/)")
+    parser.add_argument('--output-folder', help="Folder for the plots (default: the folder of the store)")
+    args = parser.parse_args()
+    output_folder = args.output_folder or os.path.dirname(os.path.abspath(args.store))
+
+    store = ResultStore(args.store)
+    df = store.read(condition=args.condition, prefix=args.prefix).dropna(subset=['reference_speed', 'mean_speed', 'dist_speed'])
+    store.close()
+
+    # Extract the relevant columns
+    ir_timing_gates = df['reference_speed']  # IR timing gates
+    differential_speed = df['mean_speed']  # Differential-based speed
+    distance_speed = df['dist_speed']  # Distance-based speed
+
+    # Create Bland-Altman plots
+    bland_altman_plot(
+        ir_timing_gates,
+        differential_speed,
+        title="Fixed speed: IR Timing Gates vs Differential-Based Speed",
+        save_path=os.path.join(output_folder, f'bland_altman_diff_{args.condition}.png')
+    )
+
+    bland_altman_plot(
+        ir_timing_gates,
+        distance_speed,
+        title="Fixed speed: IR Timing Gates vs Distance-Based Speed",
+        save_path=os.path.join(output_folder, f'bland_altman_dist_{args.condition}.png')
+    )
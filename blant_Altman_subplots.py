@@ -1,6 +1,9 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import os
 import numpy as np
+from agreement import agreement_stats
+from result_store import ResultStore
+from vtg_render import get_pyplot
 
 def bland_altman_subplot(data1, data2, ax, title, y_limits=None):
     """
@@ -16,14 +19,16 @@ def bland_altman_subplot(data1, data2, ax, title, y_limits=None):
     # Calculate the mean and difference between the two methods
     mean = np.mean([data1, data2], axis=0)
     diff = data1 - data2  # Difference between methods
-    mean_diff = np.mean(diff)  # Mean of the differences
-    std_diff = np.std(diff)  # Standard deviation of the differences
+    # Bias and limits of agreement as in agreement.py (SD with n - 1 degrees of freedom)
+    stats = agreement_stats(data1, data2)
+    mean_diff = float(stats['bias'])  # Mean of the differences
+    loa_lower, loa_upper = float(stats['loa_lower']), float(stats['loa_upper'])  # Mean difference -/+ 1.96 SD
 
     # Create the Bland-Altman plot
     ax.scatter(mean, diff, alpha=0.5, label='Differences')
     ax.axhline(mean_diff, color='lime', linestyle='--', label=f'Mean Difference')
-    ax.axhline(mean_diff + 1.96 * std_diff, color='blue', linestyle='--', label=f'+1.96 SD')
-    ax.axhline(mean_diff - 1.96 * std_diff, color='blue', linestyle='--', label=f'-1.96 SD')
+    ax.axhline(loa_upper, color='blue', linestyle='--', label=f'+1.96 SD')
+    ax.axhline(loa_lower, color='blue', linestyle='--', label=f'-1.96 SD')
     ax.axhline(0, color='black', linestyle='-', linewidth=2.5)  # Solid black line at 0
     ax.set_title(title)
     ax.grid(axis='y')
@@ -32,50 +37,62 @@ def bland_altman_subplot(data1, data2, ax, title, y_limits=None):
     if y_limits:
         ax.set_ylim(y_limits)
 
-# Load the dataset
-data_path = r'c:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\results\speed_comparison_pref_speed_bland_altman.xlsx'
-df = pd.read_excel(data_path)
+if __name__ == '__main__':
+    # Load the results of one condition from the results store written by main.py
+    # (the IR timing gate speeds are imported with: python result_store.py <store> --condition <condition> --prefix tracked_data/ --import-reference <table>)
+    parser = argparse.ArgumentParser(description="Save a combined Bland-Altman plot of the IR timing gate speeds against both speed methods.")
+    parser.add_argument('store', nargs='?', default=os.path.join('results', 'results.sqlite'), help="Path to results.sqlite")
+    parser.add_argument('--condition', default='pref_speed', help="Condition to plot (default: pref_speed)")
+    parser.add_argument('--prefix', help="Only trials whose path starts with this prefix (e.g. tracked_data/)")
+    parser.add_argument('--output-folder', help="Folder for the plot (default: the folder of the store)")
+    args = parser.parse_args()
+    output_folder = args.output_folder or os.path.dirname(os.path.abspath(args.store))
 
-# Extract the relevant columns
-ir_timing_gates = df.iloc[:, 0]  # Column A: IR timing gates
-differential_speed = df.iloc[:, 1]  # Column B: Differential-based speed
-distance_speed = df.iloc[:, 2]  # Column C: Distance-based speed
+    store = ResultStore(args.store)
+    df = store.read(condition=args.condition, prefix=args.prefix).dropna(subset=['reference_speed', 'mean_speed', 'dist_speed'])
+    store.close()
 
-# Define fixed y-axis limits
-y_limits = (-0.2, 0.2)
+    # Extract the relevant columns
+    ir_timing_gates = df['reference_speed']  # IR timing gates
+    differential_speed = df['mean_speed']  # Differential-based speed
+    distance_speed = df['dist_speed']  # Distance-based speed
 
-# Create a 2:1 subplot
-fig, axes = plt.subplots(1, 2, figsize=(16, 6))  # 1 row, 2 columns
+    # Define fixed y-axis limits
+    y_limits = (-0.2, 0.2)
 
-# Plot IR Timing Gates vs Differential-Based Speed
-bland_altman_subplot(
-    ir_timing_gates,
-    differential_speed,
-    ax=axes[0],
-    title="IR Timing Gates vs Differential-Based Speed",
-    y_limits=y_limits
-)
+    # Create a 2:1 subplot
+    plt = get_pyplot()
+    fig, axes = plt.subplots(1, 2, figsize=(16, 6))  # 1 row, 2 columns
 
-# Plot IR Timing Gates vs Distance-Based Speed
-bland_altman_subplot(
-    ir_timing_gates,
-    distance_speed,
-    ax=axes[1],
-    title="IR Timing Gates vs Distance-Based Speed",
-    y_limits=y_limits
-)
+    # Plot IR Timing Gates vs Differential-Based Speed
+    bland_altman_subplot(
+        ir_timing_gates,
+        differential_speed,
+        ax=axes[0],
+        title="IR Timing Gates vs Differential-Based Speed",
+        y_limits=y_limits
+    )
 
-# Add shared labels
-fig.text(0.5, 0.04, 'Measured Speed (m/s)', ha='center', fontsize=12)  # Shared x-axis label
-fig.text(0.04, 0.5, 'Difference Between Methods (m/s)', va='center', rotation='vertical', fontsize=12)  # Shared y-axis label
+    # Plot IR Timing Gates vs Distance-Based Speed
+    bland_altman_subplot(
+        ir_timing_gates,
+        distance_speed,
+        ax=axes[1],
+        title="IR Timing Gates vs Distance-Based Speed",
+        y_limits=y_limits
+    )
 
-# Add a single legend
-handles, labels = axes[0].get_legend_handles_labels()
-fig.legend(handles, labels, loc='upper right', fontsize=10)
+    # Add shared labels
+    fig.text(0.5, 0.04, 'Measured Speed (m/s)', ha='center', fontsize=12)  # Shared x-axis label
+    fig.text(0.04, 0.5, 'Difference Between Methods (m/s)', va='center', rotation='vertical', fontsize=12)  # Shared y-axis label
 
-# Adjust layout and save the figure
-plt.tight_layout(rect=[0.05, 0.05, 0.95, 0.95])  # Adjust layout to add more space around the graph
-save_path = r'c:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\results\bland_altman_combined_pref.png'
-plt.savefig(save_path)
-plt.close()
-print(f"Bland-Altman combined plot saved to {save_path}")
\ No newline at end of file
+    # Add a single legend
+    handles, labels = axes[0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='upper right', fontsize=10)
+
+    # Adjust layout and save the figure
+    plt.tight_layout(rect=[0.05, 0.05, 0.95, 0.95])  # Adjust layout to add more space around the graph
+    save_path = os.path.join(output_folder, f'bland_altman_combined_{args.condition}.png')
+    plt.savefig(save_path)
+    plt.close()
+    print(f"Bland-Altman combined plot saved to {save_path}")
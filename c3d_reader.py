@@ -0,0 +1,225 @@
+import struct
+
+import numpy as np
+
+# Processor types in the parameter section header (Intel and DEC are little-endian, MIPS big-endian)
+PROCESSOR_INTEL = 84
+PROCESSOR_DEC = 85
+PROCESSOR_MIPS = 86
+BLOCK_SIZE = 512
+
+
+def _dec_to_ieee(raw):
+    """
+    Convert DEC (VAX F) floats stored as little-endian uint32 to IEEE float32.
+    """
+    raw = np.asarray(raw, dtype='<u4')
+    # Swap the 16-bit words, then divide by 4 to correct the exponent bias
+    swapped = ((raw & 0xFFFF) << 16) | (raw >> 16)
+    return swapped.astype('<u4').view('<f4') / 4
+
+
+def _read_parameters(buffer, start, processor):
+    """
+    Parse the parameter section of a C3D file.
+
+    Returns a dictionary keyed by 'GROUP:PARAMETER' with the decoded values.
+    """
+    byte_order = '>' if processor == PROCESSOR_MIPS else '<'
+    groups = {}
+    raw_parameters = []
+    pos = start + 4
+    while pos < len(buffer):
+        n_chars, group_id = struct.unpack('bb', buffer[pos:pos + 2])
+        if n_chars == 0 or group_id == 0:
+            break
+        name = buffer[pos + 2:pos + 2 + abs(n_chars)].decode('latin-1').upper()
+        pos += 2 + abs(n_chars)
+        next_offset = struct.unpack(byte_order + 'h', buffer[pos:pos + 2])[0]
+        entry = pos
+        if group_id < 0:
+            groups[-group_id] = name
+        else:
+            data_type, n_dims = struct.unpack('bb', buffer[entry + 2:entry + 4])
+            dims = list(buffer[entry + 4:entry + 4 + n_dims])
+            data_start = entry + 4 + n_dims
+            raw_parameters.append((group_id, name, data_type, dims, data_start))
+        if next_offset == 0:
+            break
+        pos += next_offset
+
+    parameters = {}
+    for group_id, name, data_type, dims, data_start in raw_parameters:
+        count = int(np.prod(dims)) if dims else 1
+        if data_type == -1:
+            # Character data: the first dimension is the string length
+            text = buffer[data_start:data_start + count].decode('latin-1')
+            if len(dims) <= 1:
+                value = text.strip()
+            elif dims[0] == 0:
+                value = []
+            else:
+                length = dims[0]
+                value = [text[i:i + length].strip() for i in range(0, len(text), length)]
+        else:
+            size = abs(data_type)
+            raw = buffer[data_start:data_start + count * size]
+            if data_type == 4 and processor == PROCESSOR_DEC:
+                value = _dec_to_ieee(np.frombuffer(raw, dtype='<u4'))
+            else:
+                dtype = {1: 'i1', 2: byte_order + 'i2', 4: byte_order + 'f4'}[data_type]
+                value = np.frombuffer(raw, dtype=dtype)
+            value = value.reshape(dims[::-1]) if len(dims) > 1 else value
+        parameters[f"{groups.get(group_id, str(group_id))}:{name}"] = value
+    return parameters
+
+
+def _scalar(parameters, key, default=None):
+    value = parameters.get(key)
+    if value is None or np.size(value) == 0:
+        return default
+    return np.ravel(value)[0].item()
+
+
+def _read_layout(file_path):
+    """
+    Read the header block and parameter section of a C3D file.
+
+    Returns the header dictionary (same keys as qtm_reader) and the layout
+    of the 3D point block.
+    """
+    with open(file_path, 'rb') as f:
+        first_block = f.read(BLOCK_SIZE)
+        parameter_block = first_block[0]
+        if len(first_block) < BLOCK_SIZE or first_block[1] != 0x50:
+            raise ValueError(f"Invalid C3D file: {file_path}")
+        f.seek((parameter_block - 1) * BLOCK_SIZE)
+        parameter_header = f.read(4)
+        n_blocks = parameter_header[2]
+        processor = parameter_header[3]
+        if processor not in (PROCESSOR_INTEL, PROCESSOR_DEC, PROCESSOR_MIPS):
+            raise ValueError(f"Invalid C3D file: unknown processor type {processor}.")
+        f.seek((parameter_block - 1) * BLOCK_SIZE)
+        parameter_section = f.read(max(n_blocks, 1) * BLOCK_SIZE)
+
+    byte_order = '>' if processor == PROCESSOR_MIPS else '<'
+    n_points, n_analog, first_frame, last_frame = struct.unpack(byte_order + 'hhHH', first_block[2:10])
+    if processor == PROCESSOR_DEC:
+        scale = float(_dec_to_ieee(np.frombuffer(first_block[12:16], dtype='<u4'))[0])
+        frame_rate = float(_dec_to_ieee(np.frombuffer(first_block[20:24], dtype='<u4'))[0])
+    else:
+        scale = struct.unpack(byte_order + 'f', first_block[12:16])[0]
+        frame_rate = struct.unpack(byte_order + 'f', first_block[20:24])[0]
+    data_block = struct.unpack(byte_order + 'h', first_block[16:18])[0]
+
+    parameters = _read_parameters(parameter_section, 0, processor)
+
+    # Parameters take precedence over the header block
+    n_points = _scalar(parameters, 'POINT:USED', n_points)
+    scale = _scalar(parameters, 'POINT:SCALE', scale)
+    frame_rate = _scalar(parameters, 'POINT:RATE', frame_rate)
+    data_block = _scalar(parameters, 'POINT:DATA_START', data_block)
+    n_frames = _scalar(parameters, 'POINT:FRAMES', last_frame - first_frame + 1)
+    if n_frames < 0:
+        n_frames += 65536  # Stored as a signed 16-bit integer
+
+    labels = parameters.get('POINT:LABELS', [])
+    labels = [labels] if isinstance(labels, str) else list(labels)
+    # More than 255 points are labelled in LABELS2, LABELS3, ...
+    i = 2
+    while f'POINT:LABELS{i}' in parameters:
+        extra = parameters[f'POINT:LABELS{i}']
+        labels += [extra] if isinstance(extra, str) else list(extra)
+        i += 1
+    labels = labels[:n_points]
+    labels += [f"Point_{j + 1}" for j in range(len(labels), n_points)]
+
+    units = parameters.get('POINT:UNITS', 'mm')
+    units = units if isinstance(units, str) else (units[0] if len(units) else 'mm')
+
+    header = {
+        'NO_OF_FRAMES': int(n_frames),
+        'NO_OF_MARKERS': int(n_points),
+        'FREQUENCY': float(frame_rate),
+        'MARKER_NAMES': labels,
+        'FIRST_FRAME': int(first_frame)
+    }
+    layout = {
+        'processor': processor,
+        'byte_order': byte_order,
+        'scale': float(scale),
+        'data_offset': (int(data_block) - 1) * BLOCK_SIZE,
+        'n_points': int(n_points),
+        'n_analog': int(n_analog),
+        'n_frames': int(n_frames),
+        'to_mm': 1000.0 if units.strip().lower() == 'm' else 1.0
+    }
+    return header, layout
+
+
+def read_c3d_header(file_path):
+    """
+    Read the header of a C3D file.
+
+    Parameters:
+    - file_path: Path to the C3D file.
+
+    Returns a dictionary with NO_OF_FRAMES, NO_OF_MARKERS, FREQUENCY and
+    MARKER_NAMES, like qtm_reader.read_qtm_header.
+    """
+    header, _ = _read_layout(file_path)
+    return header
+
+
+def read_c3d(file_path, markers=None, dtype=np.float64):
+    """
+    Read selected marker trajectories from a C3D file.
+
+    The whole 3D point block (including interleaved analog samples) is read
+    in one vectorized read and the requested markers are sliced from it.
+    Same interface as qtm_reader.read_qtm_tsv: coordinates are returned in
+    mm and missing samples (negative residual) as 0.000, like a QTM TSV export.
+
+    Parameters:
+    - file_path: Path to the C3D file.
+    - markers: List of marker names to read (default: all markers).
+    - dtype: Data type of the returned array.
+
+    Returns the header dictionary and an array of shape (n_frames, n_markers, 3).
+    Raises KeyError if a requested marker is not in MARKER_NAMES.
+    """
+    header, layout = _read_layout(file_path)
+    marker_names = header['MARKER_NAMES']
+    if markers is None:
+        markers = marker_names
+    missing = [name for name in markers if name not in marker_names]
+    if missing:
+        raise KeyError(f"Marker(s) not found in {file_path}: {', '.join(missing)}")
+    indices = [marker_names.index(name) for name in markers]
+
+    is_float = layout['scale'] < 0
+    values_per_frame = 4 * layout['n_points'] + layout['n_analog']
+    count = layout['n_frames'] * values_per_frame
+    if is_float and layout['processor'] == PROCESSOR_DEC:
+        raw = np.fromfile(file_path, dtype='<u4', count=count, offset=layout['data_offset'])
+    else:
+        item = layout['byte_order'] + ('f4' if is_float else 'i2')
+        raw = np.fromfile(file_path, dtype=item, count=count, offset=layout['data_offset'])
+    n_frames = len(raw) // values_per_frame
+    frames = raw[:n_frames * values_per_frame].reshape(n_frames, values_per_frame)
+
+    # Points are stored as X, Y, Z, residual/camera word
+    points = frames[:, :4 * layout['n_points']].reshape(n_frames, layout['n_points'], 4)[:, indices]
+    if is_float and layout['processor'] == PROCESSOR_DEC:
+        points = _dec_to_ieee(points).reshape(points.shape)
+    if is_float:
+        residual = points[:, :, 3]
+        data = points[:, :, :3].astype(dtype) * layout['to_mm']
+    else:
+        # Integer format: the residual word is stored in the high/low bytes, negative means invalid
+        residual = points[:, :, 3].astype(np.int16)
+        data = points[:, :, :3].astype(dtype) * (layout['scale'] * layout['to_mm'])
+    data[residual < 0] = 0.0
+
+    header['NO_OF_FRAMES'] = n_frames
+    return header, data
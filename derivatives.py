@@ -0,0 +1,116 @@
+from functools import lru_cache
+
+import numpy as np
+
+# Methods to differentiate positions: 'diff' is the forward difference with the last value
+# repeated (as the original v_t_g), the others smooth the noise of the markers
+DERIVATIVE_METHODS = ('diff', 'butterworth', 'savgol', 'spline')
+
+
+@lru_cache(maxsize=64)
+def butterworth_sos(fs, cutoff, order=4):
+    """
+    Return the second-order sections of a low-pass Butterworth filter (cached by fs, cutoff and order).
+    """
+    from scipy.signal import butter
+    if not 0 < cutoff < fs / 2:
+        raise ValueError(f"Cutoff frequency must be between 0 and {fs / 2:g} Hz (fs / 2).")
+    return butter(order, cutoff, btype='low', fs=fs, output='sos')
+
+
+@lru_cache(maxsize=64)
+def savgol_operator(fs, window_length, polyorder):
+    """
+    Return the Savitzky-Golay first-derivative operator of a window (cached by fs, window length and polynomial order).
+
+    Row k of the (window_length, window_length) matrix gives the derivative
+    at sample k of the window of a least-squares polynomial through it; the
+    middle row is the convolution kernel, the first and last rows are used
+    at the edges of the data.
+    """
+    if window_length % 2 == 0 or window_length <= polyorder:
+        raise ValueError("Savitzky-Golay window must be odd and longer than the polynomial order.")
+    t = np.arange(window_length, dtype=np.float64) - window_length // 2
+    vandermonde = np.vander(t, polyorder + 1, increasing=True)
+    derivative = np.zeros_like(vandermonde)
+    derivative[:, 1:] = vandermonde[:, :-1] * np.arange(1, polyorder + 1)
+    operator = derivative @ np.linalg.pinv(vandermonde) * fs
+    operator.setflags(write=False)
+    return operator
+
+
+def _central_difference(positions, fs):
+    # np.gradient: central differences inside, one-sided differences at both ends
+    return np.gradient(positions, axis=0) * fs
+
+
+def _savgol(positions, fs, window_length, polyorder):
+    n = positions.shape[0]
+    if n < window_length:
+        raise ValueError(f"At least {window_length} samples are needed for the Savitzky-Golay window.")
+    operator = savgol_operator(fs, window_length, polyorder)
+    half = window_length // 2
+    windows = np.lib.stride_tricks.sliding_window_view(positions, window_length, axis=0)
+    velocity = np.empty_like(positions)
+    velocity[half:n - half] = windows @ operator[half]
+    # Edges: derivative of the polynomial through the first and last window
+    velocity[:half] = np.tensordot(operator[:half], positions[:window_length], axes=(1, 0))
+    velocity[n - half:] = np.tensordot(operator[half + 1:], positions[n - window_length:], axes=(1, 0))
+    return velocity
+
+
+def _spline(positions, fs, smoothing):
+    from scipy.interpolate import make_smoothing_spline
+    t = np.arange(positions.shape[0]) / fs
+    flat = positions.reshape(positions.shape[0], -1)
+    try:
+        velocity = make_smoothing_spline(t, flat, lam=smoothing).derivative()(t)
+    except (TypeError, ValueError):
+        # Older SciPy versions only fit one series at a time
+        velocity = np.column_stack([make_smoothing_spline(t, column, lam=smoothing).derivative()(t) for column in flat.T])
+    return velocity.reshape(positions.shape)
+
+
+def differentiate(positions, fs, method='diff', axis=0, cutoff=10.0, order=4, window=0.05, polyorder=3, smoothing=None):
+    """
+    Velocity of positions sampled at fs Hz.
+
+    Vectorized over every axis other than the time axis, e.g. the X, Y, Z
+    coordinates of a trajectory (n_frames, 3) or many trials of equal
+    length (n_trials, n_frames, 3) with axis=1.
+
+    Parameters:
+    - positions: Positions in meters.
+    - fs: Sampling frequency (Hz).
+    - method:
+      - 'diff': Forward difference, the last value repeated (as the original v_t_g).
+      - 'butterworth': Zero-phase low-pass Butterworth filter, then central differences.
+      - 'savgol': Savitzky-Golay derivative (least-squares polynomial over a moving window).
+      - 'spline': Derivative of a smoothing spline.
+    - axis: Time axis of positions.
+    - cutoff / order: Cutoff frequency (Hz) and order of the Butterworth filter.
+    - window / polyorder: Window length (s) and polynomial order of the Savitzky-Golay filter;
+      the window is rounded to an odd number of samples.
+    - smoothing: Smoothing parameter of the spline (None selects it by generalized cross-validation).
+
+    Returns the velocity in m/s, with the same shape as positions.
+    """
+    if method not in DERIVATIVE_METHODS:
+        raise ValueError(f"Invalid derivative method. Use one of {', '.join(DERIVATIVE_METHODS)}.")
+    positions = np.moveaxis(np.asarray(positions, dtype=np.float64), axis, 0)
+    if positions.shape[0] < 2:
+        raise ValueError("At least 2 samples are needed to compute a velocity.")
+
+    if method == 'diff':
+        velocity = np.diff(positions, axis=0) * fs
+        velocity = np.concatenate((velocity, velocity[-1:]), axis=0)
+    elif method == 'butterworth':
+        from scipy.signal import sosfiltfilt
+        velocity = _central_difference(sosfiltfilt(butterworth_sos(fs, cutoff, order), positions, axis=0), fs)
+    elif method == 'savgol':
+        window_length = max(int(round(window * fs)) // 2 * 2 + 1, polyorder + 1 + polyorder % 2)
+        velocity = _savgol(positions, fs, window_length, polyorder)
+    else:
+        velocity = _spline(positions, fs, smoothing)
+
+    return np.moveaxis(velocity, 0, axis)
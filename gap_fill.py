@@ -0,0 +1,215 @@
+import numpy as np
+
+# Methods to fill marker gaps by interpolation
+INTERPOLATION_METHODS = ('linear', 'cubic')
+
+
+def detect_gaps(markers):
+    """
+    Detect missing marker samples.
+
+    QTM exports missing markers as 0.000 triples; NaN samples are treated as
+    missing as well.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3).
+
+    Returns a boolean array of shape (n_frames, n_markers), True where a marker is missing.
+    """
+    return np.all(markers == 0, axis=2) | np.any(np.isnan(markers), axis=2)
+
+
+def gap_runs(missing):
+    """
+    Find the runs of consecutive missing frames of every marker.
+
+    Parameters:
+    - missing: Boolean array of shape (n_frames, n_markers) from detect_gaps.
+
+    Returns three arrays with one entry per gap: marker index, first missing
+    frame and the frame after the last missing frame.
+    """
+    n_markers = missing.shape[1]
+    padded = np.zeros((missing.shape[0] + 2, n_markers), dtype=np.int8)
+    padded[1:-1] = missing
+    change = np.diff(padded, axis=0)
+    # Transpose so the runs are ordered by marker, then by frame
+    start_marker, start_frame = np.nonzero(change.T == 1)
+    _, stop_frame = np.nonzero(change.T == -1)
+    return start_marker, start_frame, stop_frame
+
+
+def gap_report(missing, marker_names):
+    """
+    Summarise the gaps of every marker.
+
+    Returns a dictionary keyed by marker name with the number of missing
+    frames, the number of gaps and the length of the longest gap (frames).
+    """
+    marker, start, stop = gap_runs(missing)
+    lengths = stop - start
+    n_markers = len(marker_names)
+    n_gaps = np.bincount(marker, minlength=n_markers)
+    longest = np.zeros(n_markers, dtype=np.int64)
+    np.maximum.at(longest, marker, lengths)
+    n_missing = missing.sum(axis=0)
+    return {
+        name: {
+            'missing_frames': int(n_missing[j]),
+            'gaps': int(n_gaps[j]),
+            'longest_gap': int(longest[j])
+        }
+        for j, name in enumerate(marker_names)
+    }
+
+
+def fill_gaps_rigid_body(markers, missing, target, donors):
+    """
+    Reconstruct a missing marker from other markers on the same rigid segment.
+
+    For every frame where the target is missing, the nearest frame where the
+    target is visible is used as reference. The rigid transformation (Kabsch
+    fit) that maps the donor markers visible in both frames from the
+    reference frame to the current frame is applied to the target. All
+    frames are solved at once with a batched SVD. Frames with fewer than
+    three common donors are left missing.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3), modified in place.
+    - missing: Boolean array from detect_gaps, updated in place.
+    - target: Index of the marker to reconstruct.
+    - donors: Indices of the markers on the same segment (e.g., the other pelvis markers).
+
+    Returns the number of filled frames.
+    """
+    donors = [d for d in donors if d != target]
+    ref_frames = np.flatnonzero(~missing[:, target])
+    fill_frames = np.flatnonzero(missing[:, target])
+    if len(donors) < 3 or len(ref_frames) == 0 or len(fill_frames) == 0:
+        return 0
+
+    # Nearest frame where the target is visible
+    pos = np.searchsorted(ref_frames, fill_frames)
+    before = ref_frames[np.clip(pos - 1, 0, len(ref_frames) - 1)]
+    after = ref_frames[np.clip(pos, 0, len(ref_frames) - 1)]
+    ref = np.where(np.abs(fill_frames - before) <= np.abs(after - fill_frames), before, after)
+
+    # Donors visible in both the reference and the current frame
+    weights = (~missing[ref][:, donors] & ~missing[fill_frames][:, donors]).astype(np.float64)
+    n_common = weights.sum(axis=1)
+    usable = n_common >= 3
+    if not np.any(usable):
+        return 0
+    fill_frames, ref, weights, n_common = fill_frames[usable], ref[usable], weights[usable], n_common[usable]
+
+    # Weighted Kabsch fit from the reference donors (A) to the current donors (B)
+    A = markers[ref][:, donors]
+    B = markers[fill_frames][:, donors]
+    w = weights[:, :, None]
+    centroid_A = (w * A).sum(axis=1) / n_common[:, None]
+    centroid_B = (w * B).sum(axis=1) / n_common[:, None]
+    A0 = (A - centroid_A[:, None]) * w
+    B0 = (B - centroid_B[:, None]) * w
+    H = np.einsum('kdi,kdj->kij', A0, B0)
+    U, _, Vt = np.linalg.svd(H)
+    V = Vt.transpose(0, 2, 1)
+    # Avoid reflections
+    sign = np.sign(np.linalg.det(V @ U.transpose(0, 2, 1)))
+    D = np.zeros_like(H)
+    D[:, 0, 0] = 1
+    D[:, 1, 1] = 1
+    D[:, 2, 2] = sign
+    R = V @ D @ U.transpose(0, 2, 1)
+
+    local = markers[ref, target] - centroid_A
+    markers[fill_frames, target] = np.einsum('kij,kj->ki', R, local) + centroid_B
+    missing[fill_frames, target] = False
+    return len(fill_frames)
+
+
+def fill_gaps_interpolate(markers, missing, method='linear', max_gap=None):
+    """
+    Fill gaps between visible samples by interpolation.
+
+    Gaps at the start or end of the trial are not extrapolated and stay missing.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3), modified in place.
+    - missing: Boolean array from detect_gaps, updated in place.
+    - method: 'linear' or 'cubic' (cubic spline, requires scipy).
+    - max_gap: Longest gap in frames to fill (default: fill all gaps).
+
+    Returns the number of filled samples of every marker.
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"Invalid interpolation method. Use one of {', '.join(INTERPOLATION_METHODS)}.")
+    if method == 'cubic':
+        from scipy.interpolate import CubicSpline
+
+    n_frames, n_markers = missing.shape
+    marker, start, stop = gap_runs(missing)
+
+    # Only fill interior gaps that are short enough
+    keep = (start > 0) & (stop < n_frames)
+    if max_gap is not None:
+        keep &= (stop - start) <= max_gap
+    fillable = np.zeros_like(missing)
+    for j, first, last in zip(marker[keep], start[keep], stop[keep]):
+        fillable[first:last, j] = True
+
+    filled = np.zeros(n_markers, dtype=np.int64)
+    for j in np.flatnonzero(fillable.any(axis=0)):
+        known = np.flatnonzero(~missing[:, j])
+        frames = np.flatnonzero(fillable[:, j])
+        if method == 'cubic' and len(known) >= 4:
+            markers[frames, j] = CubicSpline(known, markers[known, j], axis=0)(frames)
+        else:
+            for axis in range(3):
+                markers[frames, j, axis] = np.interp(frames, known, markers[known, j, axis])
+        missing[frames, j] = False
+        filled[j] = len(frames)
+    return filled
+
+
+def reconstruct_markers(markers, marker_names, targets, method='linear', donors=(), max_gap=None):
+    """
+    Fill the gaps of the target markers before the midpoint is computed.
+
+    The gaps are first filled with a rigid-body fit from the donor markers
+    (if given), then the remaining interior gaps are interpolated. Samples
+    that cannot be reconstructed are set to NaN, so they are excluded from
+    the speed calculations instead of being read as positions at the origin.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3).
+    - marker_names: Names of the markers in the array.
+    - targets: Names of the markers to reconstruct.
+    - method: Interpolation method, 'linear' or 'cubic'.
+    - donors: Names of the markers on the same rigid segment used for the rigid-body fill,
+      or a dictionary {target: [donors]} with the donors of every target.
+    - max_gap: Longest gap in frames to interpolate (default: all gaps).
+
+    Returns:
+    - markers: Copy of the array with the gaps filled.
+    - report: Gap report of every target marker with the number of missing
+      frames, gaps, longest gap and remaining (unfilled) frames.
+    """
+    markers = np.array(markers, dtype=np.float64)
+    missing = detect_gaps(markers)
+    report = gap_report(missing, marker_names)
+
+    target_indices = [marker_names.index(name) for name in targets]
+    for name, j in zip(targets, target_indices):
+        target_donors = donors.get(name, ()) if isinstance(donors, dict) else donors
+        donor_indices = [marker_names.index(donor) for donor in target_donors if donor in marker_names]
+        if donor_indices and missing[:, j].any():
+            fill_gaps_rigid_body(markers, missing, j, donor_indices)
+    fill_gaps_interpolate(markers, missing, method, max_gap)
+
+    # Samples that could not be reconstructed
+    markers[missing] = np.nan
+    remaining = missing.sum(axis=0)
+    report = {name: report[name] for name in targets}
+    for name, j in zip(targets, target_indices):
+        report[name]['unfilled_frames'] = int(remaining[j])
+    return markers, report
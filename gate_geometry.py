@@ -0,0 +1,187 @@
+import numpy as np
+
+# Unit vectors of the running directions that can be given by name
+AXES = {
+    'x': (1.0, 0.0, 0.0),
+    'y': (0.0, 1.0, 0.0),
+    '-x': (-1.0, 0.0, 0.0),
+    '-y': (0.0, -1.0, 0.0),
+}
+VERTICAL = np.array([0.0, 0.0, 1.0])
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        raise ValueError("Direction vector must not be zero.")
+    return vector / norm
+
+
+def _gate_plane(gate):
+    """
+    Return the point and normal of a gate given as a plane or a line.
+
+    - {'point': [x, y, z], 'normal': [nx, ny, nz]}: plane in lab coordinates (m).
+    - {'line': [[x1, y1], [x2, y2]]}: vertical plane through a line on the floor,
+      e.g. between the two posts of an IR timing gate (m).
+    """
+    if 'line' in gate:
+        (x1, y1), (x2, y2) = np.asarray(gate['line'], dtype=np.float64)[:, :2]
+        direction = np.array([x2 - x1, y2 - y1, 0.0])
+        normal = np.cross(direction, VERTICAL)
+        point = np.array([(x1 + x2) / 2, (y1 + y2) / 2, 0.0])
+        return point, _unit(normal)
+    if 'point' in gate and 'normal' in gate:
+        return np.asarray(gate['point'], dtype=np.float64), _unit(gate['normal'])
+    raise ValueError("Invalid gate. Use {'point': ..., 'normal': ...} or {'line': [[x1, y1], [x2, y2]]}.")
+
+
+class GateGeometry:
+    """
+    Timing gates as arbitrary planes or lines in lab coordinates.
+
+    Trajectories are mapped onto a run coordinate, so the speed functions can
+    treat the gates as two positions on a line: Timing Gate 1 is at
+    gate_1_pos = distance and Timing Gate 2 at gate_2_pos = 0, and the run
+    coordinate decreases from gate 1 to gate 2 (as with the default gates in
+    main.py). The normals are oriented from gate 1 towards gate 2, so runs in
+    both directions are handled.
+
+    For parallel gates the run coordinate is the projection onto the gate
+    normal. For gates that are not parallel (e.g. a curved lane), it is
+    interpolated between the signed distances to both gates, so both gates
+    are crossed exactly at their planes and distance is the length of the
+    lane between them.
+
+    Parameters:
+    - gate_1, gate_2: Gates as {'point': ..., 'normal': ...} or {'line': [[x1, y1], [x2, y2]]}.
+    - distance: Length of the lane between the gates in meters (default: the
+      distance between parallel gates, or between the gate points / line centers).
+    """
+
+    def __init__(self, gate_1, gate_2, distance=None):
+        point_1, normal_1 = _gate_plane(gate_1)
+        point_2, normal_2 = _gate_plane(gate_2)
+        # Orient both normals from gate 1 towards gate 2
+        if np.dot(point_2 - point_1, normal_1) < 0:
+            normal_1 = -normal_1
+        if np.dot(point_2 - point_1, normal_2) < 0:
+            normal_2 = -normal_2
+        self.points = np.stack((point_1, point_2))
+        self.normals = np.stack((normal_1, normal_2))
+        self.parallel = bool(np.allclose(normal_1, normal_2))
+        if distance is None:
+            # Parallel gates: distance between the planes; otherwise between the gate points
+            separation = point_2 - point_1
+            distance = float(np.dot(separation, normal_1) if self.parallel else np.linalg.norm(separation))
+        if distance <= 0:
+            raise ValueError("The timing gates must not be at the same position.")
+        self.distance = distance
+        self.gate_1_pos = distance
+        self.gate_2_pos = 0.0
+        # Signed distances to both gates: positions @ matrix + offset
+        self.matrix = self.normals.T
+        self.offset = -np.einsum('ij,ij->i', self.points, self.normals)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the geometry from a dictionary {'gate_1': ..., 'gate_2': ..., 'distance': ...}.
+        """
+        return cls(config['gate_1'], config['gate_2'], config.get('distance'))
+
+    def project(self, positions):
+        """
+        Map positions of shape (n, 3) in meters to the run coordinate, in one matrix product.
+        """
+        signed = positions @ self.matrix + self.offset
+        if self.parallel:
+            return self.distance - signed[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = signed[:, 0] / (signed[:, 0] - signed[:, 1])
+        return self.distance * (1 - fraction)
+
+
+def run_axis(running_direction):
+    """
+    Return the unit vector of a running direction given as 'x', 'y', '-x', '-y' or a vector in lab coordinates.
+    """
+    if isinstance(running_direction, str):
+        if running_direction not in AXES:
+            raise ValueError(f"Invalid running direction. Use one of {', '.join(AXES)}, a direction vector or a GateGeometry.")
+        return np.array(AXES[running_direction])
+    vector = np.zeros(3)
+    values = np.asarray(running_direction, dtype=np.float64).ravel()
+    vector[:len(values)] = values
+    return _unit(vector)
+
+
+def project_run_axis(test_marker, running_direction):
+    """
+    Position of every sample along the running direction.
+
+    Parameters:
+    - test_marker: Trajectory of shape (n, 3) in meters.
+    - running_direction: 'x', 'y', '-x', '-y', a direction vector, or a GateGeometry.
+
+    Returns an array of shape (n,). For 'x' and 'y' this is the X or Y
+    column of test_marker.
+    """
+    if isinstance(running_direction, GateGeometry):
+        return running_direction.project(test_marker)
+    if isinstance(running_direction, str) and running_direction in ('x', 'y'):
+        return test_marker[:, 'xy'.index(running_direction)]
+    return test_marker @ run_axis(running_direction)
+
+
+def gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos):
+    """
+    Return the positions of the timing gates on the run coordinate; a GateGeometry defines its own.
+
+    For 'x', 'y', '-x' and '-y' the gate positions are lab coordinates on
+    that axis; for '-x' and '-y' they are negated along with the axis. For a
+    direction vector they are positions along the vector (the projection of
+    the gate positions in lab coordinates onto it).
+
+    On the run coordinate Timing Gate 1 must be above Timing Gate 2 (the
+    runner moves towards lower values): for 'x' and 'y' Timing Gate 1 has
+    the larger lab coordinate, for '-x' and '-y' the smaller one. Raises
+    ValueError otherwise.
+    """
+    if isinstance(running_direction, GateGeometry):
+        return running_direction.gate_1_pos, running_direction.gate_2_pos
+    if isinstance(running_direction, str) and running_direction.startswith('-'):
+        gate_1, gate_2 = -TIMING_GATE_1_pos, -TIMING_GATE_2_pos
+    else:
+        gate_1, gate_2 = TIMING_GATE_1_pos, TIMING_GATE_2_pos
+    if not gate_1 > gate_2:
+        if isinstance(running_direction, str):
+            order = 'smaller' if running_direction.startswith('-') else 'larger'
+            example = '-0.5 and 1.7' if running_direction.startswith('-') else '1.7 and -0.5'
+            raise ValueError(f"With running direction '{running_direction}', Timing Gate 1 must have a {order} "
+                             f"{running_direction[-1]} coordinate than Timing Gate 2 in lab coordinates (e.g. {example}), "
+                             f"got {TIMING_GATE_1_pos} and {TIMING_GATE_2_pos}.")
+        raise ValueError(f"Timing Gate 1 must be further along the direction vector than Timing Gate 2, "
+                         f"got {TIMING_GATE_1_pos} and {TIMING_GATE_2_pos}.")
+    return gate_1, gate_2
+
+
+def gate_planes(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos):
+    """
+    Return the (point, normal) of both timing gates in lab coordinates, e.g. to draw them.
+    """
+    if isinstance(running_direction, GateGeometry):
+        return list(zip(running_direction.points, running_direction.normals))
+    axis = run_axis(running_direction)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+    return [(TIMING_GATE_1_pos * axis, axis), (TIMING_GATE_2_pos * axis, axis)]
+
+
+def running_direction_from_params(params):
+    """
+    Return the GateGeometry of params['gate_geometry'] if it is set, else params['running_direction'].
+    """
+    if params.get('gate_geometry'):
+        return GateGeometry.from_config(params['gate_geometry'])
+    return params['running_direction']
@@ -0,0 +1,176 @@
+import glob
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+METRICS_NAME = 'metrics.jsonl'
+PROFILE_MODES = (None, 'cprofile', 'tracemalloc')
+
+
+class TrialMetrics:
+    """
+    Stage timers and counters of a single trial.
+
+    Stages are timed with context managers:
+
+        metrics = TrialMetrics(file_path)
+        with metrics.timer('read'):
+            ...
+        metrics.count('rows_parsed', n_frames)
+
+    Failures are counted by exception type, together with the stage in
+    which they happened.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.stages = {}
+        self.counters = Counter()
+        self.failures = Counter()
+        self.errors = []
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += int(n)
+
+    def failure(self, stage, error):
+        """
+        Record an exception raised in stage.
+        """
+        self.failures[type(error).__name__] += 1
+        self.errors.append(f"{stage}: {type(error).__name__}: {error}")
+
+    @contextmanager
+    def profiled(self, mode, output_folder):
+        """
+        Profile the enclosed code.
+
+        - 'cprofile' saves the cProfile statistics to <trial>.prof in output_folder.
+        - 'tracemalloc' records the peak traced memory in the counter peak_memory_kib.
+        - None does not profile.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid profile mode. Use one of {', '.join(str(m) for m in PROFILE_MODES)}.")
+        if mode == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                name = os.path.splitext(os.path.basename(self.file_path))[0]
+                profiler.dump_stats(os.path.join(output_folder, f"{name}.prof"))
+        elif mode == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                self.counters['peak_memory_kib'] = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+        else:
+            yield
+
+    def to_dict(self):
+        return {
+            'file': self.file_path,
+            'pid': os.getpid(),
+            'stages': self.stages,
+            'counters': dict(self.counters),
+            'failures': dict(self.failures),
+            'errors': self.errors
+        }
+
+
+def write_metrics(metrics_folder, metrics):
+    """
+    Append the metrics of a trial as one JSON line.
+
+    Every process writes to its own file (metrics_<pid>.jsonl), so worker
+    processes never write to the same file; see collect_metrics.
+    """
+    os.makedirs(metrics_folder, exist_ok=True)
+    with open(os.path.join(metrics_folder, f"metrics_{os.getpid()}.jsonl"), 'a') as f:
+        f.write(json.dumps(metrics.to_dict()) + '\n')
+
+
+def clear_metrics(metrics_folder):
+    """
+    Remove the per-process metric files left in metrics_folder, e.g. by a run that was interrupted.
+
+    Call before a run, so collect_metrics only merges the metrics of that run.
+    """
+    for part_path in glob.glob(os.path.join(metrics_folder, 'metrics_*.jsonl')):
+        os.remove(part_path)
+
+
+def collect_metrics(metrics_folder, output_path):
+    """
+    Merge the per-process metric files of a run into output_path (JSON lines) and remove them.
+
+    output_path is only written if there are records, so a run that processes
+    no trials keeps the metrics of the previous run.
+
+    Returns the list of trial records.
+    """
+    records = []
+    part_paths = sorted(glob.glob(os.path.join(metrics_folder, 'metrics_*.jsonl')))
+    for part_path in part_paths:
+        with open(part_path, 'r') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    records.sort(key=lambda record: record['file'])
+    if records:
+        with open(output_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    for part_path in part_paths:
+        os.remove(part_path)
+    if os.path.isdir(metrics_folder) and not os.listdir(metrics_folder):
+        os.rmdir(metrics_folder)
+    return records
+
+
+def summarize_metrics(records):
+    """
+    Summarize trial records as tables.
+
+    Returns:
+    - stages: DataFrame with the trials, total, mean and maximum time of every stage.
+    - counters: Dictionary with the total of every counter (the maximum of peak_* counters).
+    - failures: Dictionary with the number of failures of every exception type.
+    """
+    import pandas as pd
+    times = pd.DataFrame([record['stages'] for record in records])
+    stages = pd.DataFrame({
+        'trials': times.count(),
+        'total (s)': times.sum(),
+        'mean (ms)': times.mean() * 1000,
+        'max (ms)': times.max() * 1000
+    }) if len(times.columns) else pd.DataFrame(columns=['trials', 'total (s)', 'mean (ms)', 'max (ms)'])
+    counters = Counter()
+    failures = Counter()
+    for record in records:
+        for name, value in record['counters'].items():
+            counters[name] = max(counters[name], value) if name.startswith('peak_') else counters[name] + value
+        failures.update(record['failures'])
+    return stages, dict(counters), dict(failures)
+
+
+def print_metrics_summary(records):
+    stages, counters, failures = summarize_metrics(records)
+    print(f"\nStage timings of {len(records)} trials:")
+    print(stages.round(3).to_string())
+    for name, value in counters.items():
+        print(f"{name}: {value}")
+    for name, value in failures.items():
+        print(f"Failures ({name}): {value}")
@@ -1,168 +1,488 @@
+import argparse
+import json
 import os
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from vtg_speed import v_t_g # function to calculate speed using numerical differentiation 
-from vtg_3d import plot_3d # function to plot the 3D trajectory
-from vtg_dist import v_t_g_dist # function to calculate speed using distance-based method
+from vtg_speed import v_t_g_compute # function to calculate speed using numerical differentiation 
+from vtg_dist import v_t_g_dist_compute # function to calculate speed using distance-based method
+from vtg_render import render_trial, plot_paths # functions to save the velocity, distance and 3D plots
+from trial_cache import TrialCache # cache of parsed trials shared by all stages
+from batch_runner import find_trial_files, glob_trial_files, run_batch # process-pool batch engine
+from result_manifest import MANIFEST_NAME, ResultManifest, params_hash # record of processed trials for incremental re-runs
+from result_store import RESULTS_DB_NAME, ResultStore, trial_keys, check_unique_keys # SQLite store of the per-trial results
+from gate_geometry import running_direction_from_params # timing gates as planes or lines in lab coordinates
+from instrumentation import METRICS_NAME, TrialMetrics, write_metrics, clear_metrics, collect_metrics, print_metrics_summary # stage timers and counters
+from marker_sets import resolve_marker_set, segment_donors # weighted marker sets and approximate whole-body CoM
+from segmentation import find_gate_passes # every pass through the gates of a long recording
 
-# Folder containing the TSV files
-folder_path = r'C:\Users\anderslu\OneDrive - nih.no\Documents\Qualisys\PhD_course\Data\tracked_data\FP01\pref_speed' # Path to the folder with TSV files
-output_folder = r'C:\Users\anderslu\OneDrive - nih.no\Documents\Programmering\vscode\speed_calculation\tracked_data\FP01\pref_speed' # Path to the output folder for results and plots
-os.makedirs(output_folder, exist_ok=True)  
+# Folder containing the TSV files (all settings below can be set in a config file, see run and main)
+folder_path = os.path.join('QTM_data_HFIMV9053', 'Data', 'tracked_data', 'FP01', 'pref_speed')  # Path to the folder with TSV files (subfolders are mirrored in output_folder)
+inputs = None  # Glob patterns of the trial files, e.g. ['Data/tracked_data/*/pref_speed/*.tsv'] ('**' matches any subfolders); replaces folder_path
+output_folder = os.path.join('output', 'tracked_data', 'FP01', 'pref_speed')  # Path to the output folder for results and plots
 
 # Parameters
-running_direction = 'y'  # According to the lab coordinate system
-TIMING_GATE_1_pos = 1.7  # Position in meters of timing gate 1 // 1.7 m is 0.5 m before the force plate
+running_direction = 'y'  # According to the lab coordinate system ('x', 'y', '-x', '-y' or a direction vector such as [1, 1, 0])
+TIMING_GATE_1_pos = 1.7  # Position in meters of timing gate 1 in lab coordinates (along the vector for a direction vector) // 1.7 m is 0.5 m before the force plate
 TIMING_GATE_2_pos = -0.5  # Position in meters of timing gate 2 // -0.5 m is 0.5 m after the force plate
 # Note: The timing gates are set to 0.5 m before and after the force plate to ensure the subject is running through the gates
+gate_geometry = None  # Optional timing gates as planes or lines in lab coordinates; replaces running_direction and the gate positions, e.g.
+# {'gate_1': {'line': [[0.0, 1.7], [1.5, 1.7]]}, 'gate_2': {'line': [[0.0, -0.5], [1.5, -0.5]]}}  (IR gates between two posts, x/y in m)
+# {'gate_1': {'point': [0, 1.7, 0], 'normal': [0, -1, 0]}, 'gate_2': {'point': [0, -0.5, 0], 'normal': [0, -1, 0]}, 'distance': 2.2}  (planes; distance along a curved lane)
 Target_speed = 3.5  # Target speed in m/s
 Tolerance = 10  # Tolerance in percentage (+/-)
 fs = 200  # Sampling frequency (e.g., 200 Hz)
+gate_timing = 'sample'  # 'sample' times the gates to the nearest sample, 'linear' or 'cubic' interpolate the crossing times between samples
+derivative = 'diff'  # Velocity of the differential method: 'diff' (forward difference), 'butterworth' (zero-phase low-pass + central difference), 'savgol' (Savitzky-Golay) or 'spline' (smoothing spline)
+derivative_options = {}  # Options of the derivative, e.g. {'cutoff': 10, 'order': 4} for 'butterworth', {'window': 0.05, 'polyorder': 3} for 'savgol' (see derivatives.py)
+save_speed_profiles = False  # Save the instantaneous speed within the gate range of every trial to <trial>_speed_profile.csv
+segment_passes = False  # Find and time every pass through the gates (e.g. a long session with several runs) and save them to <trial>_passes.csv
 plot_figure = 0  # Do not display plots
+render_plots = 'inline'  # 'inline' saves the plots while processing, 'deferred' saves them in a separate batch after all speeds are computed, 'off' skips them
+markers = ['SIPS_left', 'SIPS_right']  # Markers used to compute the midpoint trajectory
+marker_set = None  # Weighted centroid used instead of the midpoint of markers: 'sips_midpoint', 'pelvis', 'trunk', 'com' (approximate whole-body CoM) or {segment: (weight, [markers])} (see marker_sets.py)
+gap_fill = 'linear'  # Fill missing marker samples (0.000 in the TSV) before the midpoint is computed: 'linear', 'cubic' or 'off'
+donor_markers = ['SIAS_left', 'SIAS_right', 'becken_top_left', 'becken_top_right']  # Other pelvis markers used to reconstruct missing markers as a rigid body ([] to only interpolate)
+max_gap = None  # Longest gap in frames to interpolate (None fills all gaps)
+trial_extension = '.tsv'  # '.tsv' for QTM exports, '.c3d' for C3D files or '.npy' for trials converted with trajectory_store.py
+recursive = True  # Also process the TSV files in subfolders (e.g., subject/condition trees)
+max_workers = None  # Number of worker processes (None uses all CPU cores, 1 processes the files one by one)
+store_keys = None  # Folders of the path below the input folder saved as subject and condition in results.sqlite, e.g. {'subject': 0, 'condition': 2} (None: the two folders above each file)
+export_excel = True  # Also save speed_comparison.xlsx per output folder (all results are always saved to results.sqlite in output_folder)
+incremental = True  # Only process trials whose data or parameters changed since the last run (recorded in manifest.json in output_folder)
+cache_max_bytes = 512 * 1024 ** 2  # Memory bound of the trial cache in bytes
+metrics = True  # Save the stage timings and counters of every trial to metrics.jsonl in output_folder and print a summary
+profile = None  # Profile every trial: 'cprofile' saves <trial>.prof next to the plots, 'tracemalloc' records the peak memory in metrics.jsonl
 
-# Initialize a list to store results
-results = []
+# Names of the settings above, which can be set in a config file or passed to run
+SETTINGS = (
+    'folder_path', 'inputs', 'output_folder', 'running_direction', 'TIMING_GATE_1_pos', 'TIMING_GATE_2_pos', 'gate_geometry',
+    'Target_speed', 'Tolerance', 'fs', 'gate_timing', 'derivative', 'derivative_options', 'save_speed_profiles', 'segment_passes',
+    'plot_figure',
+    'render_plots', 'markers', 'marker_set', 'gap_fill', 'donor_markers', 'max_gap', 'trial_extension', 'recursive',
+    'max_workers', 'store_keys', 'export_excel', 'incremental', 'cache_max_bytes', 'metrics', 'profile'
+)
 
-def process_file(file_path, filename):
+# Key of the plot data in the result rows of process_file with deferred rendering (ignored by the results store, removed by run)
+PLOT_DATA_KEY = '_plot_data'
+
+# Each TSV file is parsed once per process and reused by the speed, distance and 3D stages
+_trial_caches = {}
+
+
+def get_trial_cache(params):
+    """
+    Return the trial cache of this process for the markers, marker set and gap filling settings in params.
+    """
+    marker_set = params.get('marker_set')
+    key = (tuple(params['markers']), repr(marker_set), params['gap_fill'], tuple(params['donor_markers']), params['max_gap'])
+    if key not in _trial_caches:
+        marker_names = resolve_marker_set(marker_set)[0] if marker_set else params['markers']
+        _trial_caches[key] = TrialCache(
+            marker_names,
+            max_bytes=params['cache_max_bytes'],
+            gap_fill=params['gap_fill'],
+            donor_markers=params['donor_markers'],
+            max_gap=params['max_gap'],
+            marker_set=marker_set or None,
+            donors=segment_donors(marker_set, params['donor_markers']) if marker_set else None
+        )
+    return _trial_caches[key]
+
+
+def kernel_args(params):
+    """
+    Return the positional arguments shared by v_t_g_compute and v_t_g_dist_compute.
+    """
+    return (
+        running_direction_from_params(params),
+        params['TIMING_GATE_1_pos'],
+        params['TIMING_GATE_2_pos'],
+        params['Target_speed'],
+        params['Tolerance'],
+        params['fs']
+    )
+
+
+def process_file(file_path, output_folder, params):
     """
     Process a single TSV file to calculate mean speed and validate it.
+
+    All settings are passed in params, so the function can run in a worker process.
+    The stage timings and counters of the trial are written to the metrics
+    folder if params['metrics_folder'] is set.
     """
-    try:
-        data = pd.read_csv(file_path, sep='\t', skiprows=11)  
-    except Exception as e:
-        print(f"Error: Failed to read TSV file {filename}. {e}")
-        return None
+    metrics = TrialMetrics(file_path)
+    with metrics.profiled(params['profile'], output_folder):
+        result = process_trial(file_path, output_folder, params, metrics)
+    if params['metrics_folder'] is not None:
+        write_metrics(params['metrics_folder'], metrics)
+    return result
+
 
-    # Extract SIPS_left and SIPS_right x, y, z columns
+def process_trial(file_path, output_folder, params, metrics):
+    """
+    Calculate the speeds of a single trial, timing every stage in metrics.
+    """
+    filename = os.path.basename(file_path)
+    print(f"Processing file: {filename}")
+
+    # Read the SIPS_left and SIPS_right x, y, z columns and their midpoint (in meters)
     try:
-        left_x = data['SIPS_left X'].to_numpy() / 1000  # Convert to meters
-        left_y = data['SIPS_left Y'].to_numpy() / 1000  # Convert to meters
-        left_z = data['SIPS_left Z'].to_numpy() / 1000  # Convert to meters
-        right_x = data['SIPS_right X'].to_numpy() / 1000  # Convert to meters
-        right_y = data['SIPS_right Y'].to_numpy() / 1000  # Convert to meters
-        right_z = data['SIPS_right Z'].to_numpy() / 1000  # Convert to meters
+        trial = get_trial_cache(params).get(file_path, metrics)
     except KeyError as e:
+        metrics.failure('read', e)
         print(f"Error: Missing column in TSV data {filename}. {e}")
         return None
+    except Exception as e:
+        metrics.failure('read', e)
+        print(f"Error: Failed to read TSV file {filename}. {e}")
+        return None
 
-    # Compute the midpoint between SIPS_left and SIPS_right
-    mid_x = (left_x + right_x) / 2
-    mid_y = (left_y + right_y) / 2
-    mid_z = (left_z + right_z) / 2
+    marker_to_use = trial.midpoint
+    metrics.count('rows_parsed', len(marker_to_use))
 
-    # Combine the midpoint coordinates into a single array
-    marker_to_use = np.column_stack((mid_x, mid_y, mid_z))
+    # Report the gaps of the midpoint markers
+    gap_frames = 0
+    unfilled_frames = 0
+    if trial.gaps is not None:
+        for marker_name, gaps in trial.gaps.items():
+            if gaps['missing_frames'] > 0:
+                print(f"Warning: {marker_name} is missing in {gaps['missing_frames']} frames of {filename} "
+                      f"({gaps['gaps']} gaps, longest {gaps['longest_gap']} frames, {gaps['unfilled_frames']} not reconstructed).")
+            gap_frames += gaps['missing_frames']
+            unfilled_frames += gaps['unfilled_frames']
+    metrics.count('gap_frames', gap_frames)
 
     # Calculate the speed using numerical differentiation
     try:
-        mean_speed, is_valid = v_t_g(
-            marker_to_use,
-            running_direction,
-            TIMING_GATE_1_pos,
-            TIMING_GATE_2_pos,
-            Target_speed,
-            Tolerance,
-            fs,
-            plot_figure
-        )
+        with metrics.timer('v_t_g'):
+            speed_result = v_t_g_compute(marker_to_use, *kernel_args(params), params['derivative'], params['derivative_options'])
     except Exception as e:
+        metrics.failure('v_t_g', e)
         print(f"Error processing file {filename} with v_t_g: {e}")
         return None
+    metrics.count('samples_in_range', len(speed_result['velocity']))
 
-    # Save the velocity plot
-    velocity_plot_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_velocity_plot.png")
-    plt.savefig(velocity_plot_path)  # Save the plot generated in v_t_g
-    plt.close()
+    # Save the instantaneous speed profile
+    if params['save_speed_profiles']:
+        import pandas as pd
+        profile_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_speed_profile.csv")
+        pd.DataFrame({'Time (s)': speed_result['time'], 'Speed (m/s)': speed_result['speed_profile']}).to_csv(profile_path, index=False)
 
     # Call the distance-based speed calculation function
     try:
-        dist_speed, dist_is_valid = v_t_g_dist(
-            marker_to_use,
-            running_direction,
-            TIMING_GATE_1_pos,
-            TIMING_GATE_2_pos,
-            Target_speed,
-            Tolerance,
-            fs,
-            plot_figure
-        )
+        with metrics.timer('v_t_g_dist'):
+            dist_result = v_t_g_dist_compute(marker_to_use, *kernel_args(params), crossing=params['gate_timing'])
     except Exception as e:
+        metrics.failure('v_t_g_dist', e)
         print(f"Error processing file {filename} with v_t_g_dist: {e}")
         return None
+    metrics.count('samples_between_gates', int(dist_result['end_index']) - int(np.ceil(dist_result['start_index'])) + 1)
 
-    # Save the distance-based speed plot
-    dist_plot_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_distance_plot.png")
-    plt.savefig(dist_plot_path)  # Save the plot generated in v_t_g_dist
-    plt.close()
+    # Time every pass through the gates of a long recording
+    if params['segment_passes']:
+        try:
+            with metrics.timer('segment_passes'):
+                passes = find_gate_passes(marker_to_use, *kernel_args(params), crossing=params['gate_timing'])
+        except Exception as e:
+            metrics.failure('segment_passes', e)
+            print(f"Error segmenting the passes of {filename}: {e}")
+            return None
+        metrics.count('gate_passes', len(passes['speed']))
+        print(f"Found {len(passes['speed'])} passes through the timing gates in {filename}.")
+        import pandas as pd
+        pd.DataFrame({
+            'Pass': np.arange(1, len(passes['speed']) + 1),
+            'Start Time (s)': passes['start_time'],
+            'Time Between Gates (s)': passes['time_between_gates'],
+            'Speed (m/s)': passes['speed'],
+            'Direction': passes['direction'],
+            'Valid': passes['is_valid'],
+            'Gap Frames': passes['gap_frames']
+        }).to_csv(os.path.join(output_folder, f"{os.path.splitext(filename)[0]}_passes.csv"), index=False)
 
-    return {
+    # Save the velocity, distance-based speed and 3D plots
+    if params['render_plots'] == 'inline':
+        try:
+            render_trial(marker_to_use, speed_result, dist_result, filename, output_folder, params, metrics)
+        except Exception as e:
+            metrics.failure('savefig', e)
+            print(f"Error saving plots for {filename}: {e}")
+
+    result = {
         'Filename': filename,
-        'Mean Speed (m/s)': mean_speed,
-        'Valid (Mean Speed)': is_valid,
-        'Distance-Based Speed (m/s)': dist_speed,
-        'Valid (Distance-Based Speed)': dist_is_valid
+        'Mean Speed (m/s)': speed_result['mean_speed'],
+        'Valid (Mean Speed)': speed_result['is_valid'],
+        'Distance-Based Speed (m/s)': dist_result['speed'],
+        'Valid (Distance-Based Speed)': dist_result['is_valid'],
+        'Gap Frames': gap_frames,
+        'Unfilled Gap Frames': unfilled_frames
     }
+    # Return what the plots need with the result, so deferred rendering neither re-parses the trial nor recomputes the speeds
+    if params['render_plots'] == 'deferred':
+        result[PLOT_DATA_KEY] = (marker_to_use, speed_result, dist_result)
+    return result
+
+
+def render_file(file_path, output_folder, params, plot_data=None):
+    """
+    Save the plots of a single TSV file on request.
+
+    Used for deferred rendering after all speeds are computed. plot_data is
+    the (midpoint, speed result, distance result) returned by process_file
+    under PLOT_DATA_KEY; without it the trial is taken from the trial cache
+    and the speeds are recomputed.
+    """
+    filename = os.path.basename(file_path)
+    if plot_data is not None:
+        marker_to_use, speed_result, dist_result = plot_data
+    else:
+        marker_to_use = get_trial_cache(params).get(file_path).midpoint
+        speed_result = v_t_g_compute(marker_to_use, *kernel_args(params), params['derivative'], params['derivative_options'])
+        dist_result = v_t_g_dist_compute(marker_to_use, *kernel_args(params), crossing=params['gate_timing'])
+    render_trial(marker_to_use, speed_result, dist_result, filename, output_folder, params)
+    return filename
+
+
+def trial_artifacts(filename, output_folder, params):
+    """
+    Return the paths of the files saved for a trial besides its result row (plots and CSV files).
+    """
+    name = os.path.splitext(filename)[0]
+    artifacts = plot_paths(filename, output_folder) if params['render_plots'] != 'off' else []
+    if params['save_speed_profiles']:
+        artifacts.append(os.path.join(output_folder, f"{name}_speed_profile.csv"))
+    if params['segment_passes']:
+        artifacts.append(os.path.join(output_folder, f"{name}_passes.csv"))
+    return artifacts
+
+
+def add_bounds(result, params):
+    """
+    Return a copy of a result row with the target speed and its lower and upper bounds.
+    """
+    row = dict(result)
+    row['Target Speed (m/s)'] = params['Target_speed']
+    row['Lower Bound (m/s)'] = params['Target_speed'] * (1 - params['Tolerance'] / 100)
+    row['Upper Bound (m/s)'] = params['Target_speed'] * (1 + params['Tolerance'] / 100)
+    return row
+
+
+def save_results(results, output_folder, params):
+    """
+    Save the results of one folder to speed_comparison.xlsx.
+    """
+    import pandas as pd
 
-# Loop through all TSV files in the folder
-for filename in os.listdir(folder_path):
-    if filename.endswith('.tsv'):
-        file_path = os.path.join(folder_path, filename)
-        print(f"Processing file: {filename}")
-        result = process_file(file_path, filename)
-        if result:
-            results.append(result)
-
-# Save results to an Excel file
-results_df = pd.DataFrame(results)
-
-# Add additional columns for target speed, upper and lower bounds
-results_df['Target Speed (m/s)'] = Target_speed
-results_df['Lower Bound (m/s)'] = Target_speed * (1 - Tolerance / 100)
-results_df['Upper Bound (m/s)'] = Target_speed * (1 + Tolerance / 100)
-
-# Define the Excel file path
-results_excel_path = os.path.join(output_folder, 'speed_comparison.xlsx')
-
-# Save to Excel
-results_df.to_excel(results_excel_path, index=False)
-print(f"Results saved to {results_excel_path}")
-
-# Generate a 3D plot for each processed file
-for result in results:
-    file_path = os.path.join(folder_path, result['Filename'])
-    print(f"Generating 3D plot for: {result['Filename']}")
+    # Add additional columns for target speed, upper and lower bounds
+    results_df = pd.DataFrame([add_bounds(result, params) for result in results])
+
+    # Define the Excel file path
+    results_excel_path = os.path.join(output_folder, 'speed_comparison.xlsx')
+
+    # Save to Excel
+    results_df.to_excel(results_excel_path, index=False)
+    print(f"Results saved to {results_excel_path}")
+
+
+def build_params(settings):
+    """
+    Return the parameters passed to process_file for the settings of a run.
+
+    Parameters:
+    - settings: Dictionary with a value for every name in SETTINGS.
+    """
+    return {
+        'running_direction': settings['running_direction'],
+        'gate_geometry': settings['gate_geometry'],
+        'TIMING_GATE_1_pos': settings['TIMING_GATE_1_pos'],
+        'TIMING_GATE_2_pos': settings['TIMING_GATE_2_pos'],
+        'Target_speed': settings['Target_speed'],
+        'Tolerance': settings['Tolerance'],
+        'fs': settings['fs'],
+        'gate_timing': settings['gate_timing'],
+        'derivative': settings['derivative'],
+        'derivative_options': settings['derivative_options'],
+        'save_speed_profiles': settings['save_speed_profiles'],
+        'segment_passes': settings['segment_passes'],
+        'plot_figure': settings['plot_figure'],
+        'render_plots': settings['render_plots'],
+        'markers': settings['markers'],
+        'marker_set': settings['marker_set'],
+        'gap_fill': settings['gap_fill'],
+        'donor_markers': settings['donor_markers'],
+        'max_gap': settings['max_gap'],
+        'cache_max_bytes': settings['cache_max_bytes'],
+        'profile': settings['profile'],
+        'metrics_folder': os.path.join(settings['output_folder'], 'metrics_parts') if settings['metrics'] else None
+    }
+
+
+def load_config(config_path):
+    """
+    Read the settings of a run from a JSON (.json) or TOML (.toml) config file.
+
+    Keys are the names of the settings at the top of main.py, e.g.
+    {"inputs": ["Data/**/*.tsv"], "output_folder": "out", "fs": 200, "max_workers": 4}.
+    """
+    extension = os.path.splitext(config_path)[1].lower()
+    if extension == '.json':
+        with open(config_path, 'r') as f:
+            return json.load(f)
+    if extension == '.toml':
+        import tomllib
+        with open(config_path, 'rb') as f:
+            return tomllib.load(f)
+    raise ValueError(f"Unsupported config file '{extension}'. Use .json or .toml.")
+
+
+def run(config=None, **overrides):
+    """
+    Calculate the speeds of all trials; the Python entry point of main.py.
+
+    Parameters:
+    - config: Dictionary of settings or path to a config file (see load_config).
+    - overrides: Settings that override config, e.g. run('speed.toml', max_workers=1).
+
+    Settings that are not given keep the values at the top of main.py.
+
+    Returns a list with the result row of every trial file (None for failed trials).
+    """
+    if isinstance(config, (str, os.PathLike)):
+        config = load_config(config)
+    config = {**(config or {}), **overrides}
+    unknown = sorted(set(config) - set(SETTINGS))
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(unknown)}. Use any of {', '.join(SETTINGS)}.")
+    settings = {**{name: globals()[name] for name in SETTINGS}, **config}
+    output_folder = settings['output_folder']
+
+    params = build_params(settings)
+
+    # One task per trial file; subfolders of folder_path are mirrored in output_folder
+    if settings['inputs']:
+        folder_path, file_paths = glob_trial_files(settings['inputs'])
+    else:
+        folder_path = settings['folder_path']
+        file_paths = find_trial_files(folder_path, settings['trial_extension'], settings['recursive'])
+    tasks = []
+    for file_path in file_paths:
+        relative_folder = os.path.relpath(os.path.dirname(file_path), folder_path)
+        trial_output_folder = os.path.normpath(os.path.join(output_folder, relative_folder))
+        os.makedirs(trial_output_folder, exist_ok=True)
+        tasks.append((file_path, trial_output_folder, params))
+
+    # Trials are saved in results.sqlite by their path relative to folder_path
+    keys = [trial_keys(file_path, folder_path, settings['store_keys']) for file_path, _, _ in tasks]
+    check_unique_keys(keys)
+
+    # Reuse the results of trials whose data and parameters are unchanged since the last run and whose files still exist
+    manifest = ResultManifest(os.path.join(output_folder, MANIFEST_NAME)) if settings['incremental'] else None
+    param_hash = params_hash(params)
+    results = [None] * len(tasks)
+    input_hashes = [None] * len(tasks)
+    pending = []
+    for i, (file_path, trial_output_folder, _) in enumerate(tasks):
+        if manifest is not None:
+            key = os.path.relpath(file_path, folder_path)
+            input_hashes[i] = manifest.input_hash(key, file_path)
+            artifacts = trial_artifacts(os.path.basename(file_path), trial_output_folder, params)
+            results[i] = manifest.lookup(key, input_hashes[i], param_hash, artifacts)
+        if results[i] is None:
+            pending.append(i)
+    if manifest is not None:
+        print(f"Skipping {len(tasks) - len(pending)} unchanged files, processing {len(pending)} files.")
+
+    # Save every result row to the results store as soon as its trial is processed
+    # (reused results are saved too, in case the store was removed)
+    store = ResultStore(os.path.join(output_folder, RESULTS_DB_NAME))
+    store.append([keys[i] + (add_bounds(results[i], params),) for i in range(len(tasks)) if results[i] is not None])
+
+    # Discard metric files left by an interrupted run, so they are not merged into this run
+    if settings['metrics']:
+        clear_metrics(params['metrics_folder'])
+
+    def save_row(index, result):
+        store.append([keys[pending[index]] + (add_bounds(result, params),)])
+
+    new_results, failures = run_batch(process_file, [tasks[i] for i in pending], settings['max_workers'], on_result=save_row)
+    store.close()
+    plot_data = {}
+    for i, result in zip(pending, new_results):
+        if result is not None and PLOT_DATA_KEY in result:
+            plot_data[i] = result.pop(PLOT_DATA_KEY)
+        results[i] = result
+
+    # Save the plots of the processed files in a separate batch, from the midpoints and speeds returned by the workers
+    if settings['render_plots'] == 'deferred':
+        render_tasks = [tasks[i] + (plot_data[i],) for i in pending if i in plot_data]
+        _, render_failures = run_batch(render_file, render_tasks, settings['max_workers'])
+        for file_path, message in render_failures:
+            print(f"Failed to save plots: {file_path}. {message}")
+
+    # Optionally save one Excel file per output folder, in the order the files were found;
+    # folders without new results are only rewritten if their Excel file is missing
+    if settings['export_excel']:
+        changed_folders = {tasks[i][1] for i in pending}
+        for trial_output_folder in dict.fromkeys(task[1] for task in tasks):
+            if trial_output_folder not in changed_folders and os.path.exists(os.path.join(trial_output_folder, 'speed_comparison.xlsx')):
+                continue
+            folder_results = [
+                result for result, task in zip(results, tasks)
+                if result is not None and task[1] == trial_output_folder
+            ]
+            if folder_results:
+                save_results(folder_results, trial_output_folder, params)
+
+    # Record the processed trials and their plots and CSV files in the manifest
+    if manifest is not None:
+        for i in pending:
+            if results[i] is None:
+                continue
+            file_path, trial_output_folder, _ = tasks[i]
+            artifacts = trial_artifacts(os.path.basename(file_path), trial_output_folder, params)
+            manifest.update(os.path.relpath(file_path, folder_path), file_path, input_hashes[i], param_hash, results[i], artifacts)
+        manifest.save()
+
+    # Merge the metrics written by the worker processes
+    if settings['metrics']:
+        records = collect_metrics(params['metrics_folder'], os.path.join(output_folder, METRICS_NAME))
+        if records:
+            print_metrics_summary(records)
+
+    print(f"Processed {len(pending) - len(failures)} of {len(pending)} files.")
+    for file_path, message in failures:
+        print(f"Failed: {file_path}. {message}")
+    return results
+
+
+def _number(text):
+    # Command line numbers as in a config file: '200' is an int, '3.5' a float
     try:
-        # Reprocess the file to extract marker_to_use
-        data = pd.read_csv(file_path, sep='\t', skiprows=11)
-        if data.empty:
-            print(f"Warning: File {result['Filename']} is empty. Skipping 3D plot generation.")
-            continue
-        left_x = data['SIPS_left X'].to_numpy() / 1000
-        left_y = data['SIPS_left Y'].to_numpy() / 1000
-        left_z = data['SIPS_left Z'].to_numpy() / 1000
-        right_x = data['SIPS_right X'].to_numpy() / 1000
-        right_y = data['SIPS_right Y'].to_numpy() / 1000
-        right_z = data['SIPS_right Z'].to_numpy() / 1000
-        mid_x = (left_x + right_x) / 2
-        mid_y = (left_y + right_y) / 2
-        mid_z = (left_z + right_z) / 2
-        marker_to_use = np.column_stack((mid_x, mid_y, mid_z))
-
-        # Generate and save the 3D plot
-        plot_3d_path = os.path.join(output_folder, f"{os.path.splitext(result['Filename'])[0]}_3d_plot.png")
-        plot_3d(
-            marker_to_use,
-            running_direction,
-            TIMING_GATE_1_pos,
-            TIMING_GATE_2_pos,
-            Target_speed,
-            Tolerance,
-            fs,
-            plot_figure,
-            save_path=plot_3d_path
-        )
-        plt.close()
-    except Exception as e:
-        print(f"Error generating 3D plot for {result['Filename']}: {e}")
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def main(argv=None):
+    """
+    Command-line entry point, e.g. python main.py --config speed.toml --workers 8 --plots off.
+    """
+    parser = argparse.ArgumentParser(description="Calculate the running speed of all trials with the settings of a config file.")
+    parser.add_argument('--config', help="JSON or TOML file with the settings of main.py (settings that are not given keep their defaults)")
+    parser.add_argument('--input', action='append', dest='inputs', metavar='GLOB', help="Glob pattern of trial files (repeat for several patterns)")
+    parser.add_argument('--output', dest='output_folder', help="Output folder for the results and plots")
+    parser.add_argument('--workers', type=int, dest='max_workers', help="Number of worker processes")
+    parser.add_argument('--fs', type=_number, help="Sampling frequency (Hz)")
+    parser.add_argument('--target-speed', type=_number, dest='Target_speed', help="Target speed (m/s)")
+    parser.add_argument('--tolerance', type=_number, dest='Tolerance', help="Tolerance of the target speed (%%)")
+    parser.add_argument('--plots', choices=['inline', 'deferred', 'off'], dest='render_plots', help="When to save the plots")
+    parser.add_argument('--no-excel', action='store_false', dest='export_excel', default=None, help="Only save the results to results.sqlite")
+    parser.add_argument('--full', action='store_false', dest='incremental', default=None, help="Process all trials, also unchanged ones")
+    args = vars(parser.parse_args(argv))
+    config = args.pop('config')
+    run(config, **{name: value for name, value in args.items() if value is not None})
+
+
 
+if __name__ == '__main__':
+    main()
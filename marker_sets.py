@@ -0,0 +1,163 @@
+import numpy as np
+
+from gap_fill import detect_gaps
+
+# Marker sets as {segment: (weight, [markers])}; the weight of a segment is shared equally by its markers
+MARKER_SETS = {
+    # Midpoint of the posterior pelvis markers (the original speed proxy)
+    'sips_midpoint': {
+        'pelvis': (1.0, ['SIPS_left', 'SIPS_right']),
+    },
+    # Centroid of all pelvis markers
+    'pelvis': {
+        'pelvis': (1.0, ['SIAS_left', 'SIAS_right', 'SIPS_left', 'SIPS_right', 'becken_top_left', 'becken_top_right']),
+    },
+    # Centroid of the trunk markers
+    'trunk': {
+        'trunk': (1.0, ['clav', 'sternum', 'C_7', 'B_10', 'acrom_left', 'acrom_right']),
+    },
+    # Approximate whole-body centre of mass with the segment masses of de Leva (1996);
+    # head, arms and trunk are one segment between the shoulder and pelvis markers
+    'com': {
+        'head_arms_trunk': (0.6028, ['clav', 'sternum', 'C_7', 'B_10', 'acrom_left', 'acrom_right',
+                                     'SIAS_left', 'SIAS_right', 'SIPS_left', 'SIPS_right']),
+        'thigh_left': (0.1416, ['cluster_femur_left_1', 'cluster_femur_left_2', 'cluster_femur_left_3', 'cluster_femur_left_4']),
+        'thigh_right': (0.1416, ['cluster_femur_right_1', 'cluster_femur_right_2', 'cluster_femur_right_3', 'cluster_femur_right_4']),
+        'shank_left': (0.0433, ['cluster_tibia_left_1', 'cluster_tibia_left_2', 'cluster_tibia_left_3', 'cluster_tibia_left_4']),
+        'shank_right': (0.0433, ['cluster_tibia_right_1', 'cluster_tibia_right_2', 'cluster_tibia_right_3', 'cluster_tibia_right_4']),
+        'foot_left': (0.0137, ['calc_back_left', 'calc_med_left', 'calc_lat_left', 'forefoot_med_left', 'forefoot_lat_left', 'toe_left']),
+        'foot_right': (0.0137, ['calc_back_right', 'calc_med_right', 'calc_lat_right', 'forfoot_med_right', 'forfoot_lat_right', 'toe_right']),
+    },
+}
+
+
+# Markers on the pelvis; segments made of these only also use the donor_markers of main.py for the rigid-body gap fill
+PELVIS_MARKERS = MARKER_SETS['pelvis']['pelvis'][1]
+
+
+def _segments(marker_set):
+    # Marker set as a dictionary {segment: (weight, [markers])}
+    if isinstance(marker_set, str):
+        if marker_set not in MARKER_SETS:
+            raise ValueError(f"Unknown marker set '{marker_set}'. Use one of {', '.join(MARKER_SETS)}, a dictionary or a list of markers.")
+        return MARKER_SETS[marker_set]
+    if not isinstance(marker_set, dict):
+        return {'markers': (1.0, list(marker_set))}
+    return marker_set
+
+
+def resolve_marker_set(marker_set, available=None):
+    """
+    Return the marker names and their weights (summing to 1) of a marker set.
+
+    Parameters:
+    - marker_set: Name of a preset in MARKER_SETS, a dictionary
+      {segment: (weight, [markers])}, or a list of markers with equal weights.
+    - available: Names of the markers in a file (default: all markers are available).
+      The weight of every segment is shared by its available markers, so a
+      segment keeps its weight when some of its markers are missing; segments
+      without any available marker are left out (see missing_segments).
+    """
+    marker_set = _segments(marker_set)
+
+    weights = {}
+    for segment, (weight, markers) in marker_set.items():
+        if not markers:
+            raise ValueError(f"Segment '{segment}' of the marker set has no markers.")
+        present = [name for name in markers if available is None or name in available]
+        for name in present:
+            weights[name] = weights.get(name, 0.0) + weight / len(present)
+    if not weights:
+        raise KeyError("None of the markers of the marker set are in the file.")
+    names = list(weights)
+    values = np.array([weights[name] for name in names])
+    if values.sum() <= 0:
+        raise ValueError("The weights of the marker set must sum to a positive value.")
+    return names, values / values.sum()
+
+
+def missing_markers(marker_set, available):
+    """
+    Return the markers of a marker set that are not in available.
+
+    Returns:
+    - segments: Segments without any marker in available (left out by resolve_marker_set).
+    - markers: Missing markers of the other segments, whose weight is shared by the rest of their segment.
+    """
+    segments, absent = [], []
+    for segment, (_, markers) in _segments(marker_set).items():
+        missing = [name for name in markers if name not in available]
+        if len(missing) == len(markers):
+            segments.append(segment)
+        else:
+            absent += [name for name in missing if name not in absent]
+    return segments, absent
+
+
+def segment_donors(marker_set, donor_markers=()):
+    """
+    Return the markers used to reconstruct every marker of a marker set as a rigid body.
+
+    Only the other markers of the same segment are used, since the segments
+    move relative to each other. Segments of pelvis markers only
+    (PELVIS_MARKERS) also use donor_markers. A marker in several segments
+    uses the markers of the first one.
+
+    Parameters:
+    - marker_set: Marker set as for resolve_marker_set.
+    - donor_markers: Other pelvis markers (see donor_markers in main.py).
+
+    Returns a dictionary {marker: [donors]} for reconstruct_markers.
+    """
+    donors = {}
+    for _, markers in _segments(marker_set).values():
+        segment = list(markers)
+        if all(name in PELVIS_MARKERS for name in segment):
+            segment += [name for name in donor_markers if name not in segment]
+        for name in markers:
+            donors.setdefault(name, [donor for donor in segment if donor != name])
+    return donors
+
+
+def segment_centroid(markers, weights, missing=None):
+    """
+    Weighted centroid of markers, with a fallback for missing markers.
+
+    Every marker j gets its mean offset o_j from the centroid over the frames
+    where all markers are visible. In every frame the centroid is estimated
+    from the visible markers as sum(w_j * (p_j - o_j)) / sum(w_j), which
+    equals the weighted centroid when all markers are visible and does not
+    jump when markers drop out. Markers that are never visible are ignored;
+    without any complete frame the offsets are zero (plain weighted mean of
+    the visible markers). Computed in one vectorized pass over all frames.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3).
+    - weights: Weight of every marker, shape (n_markers,).
+    - missing: Boolean array of shape (n_frames, n_markers), True where a
+      marker is missing (default: detect_gaps(markers)).
+
+    Returns an array of shape (n_frames, 3) in the units of markers; NaN in
+    frames where no marker is visible.
+    """
+    if missing is None:
+        missing = detect_gaps(markers)
+    weights = np.asarray(weights, dtype=np.float64)
+    visible = ~missing
+    positions = np.where(visible[:, :, None], markers, 0.0)
+
+    # Offsets from the frames where every marker that is tracked at all is visible
+    tracked = visible.any(axis=0)
+    complete = np.all(visible | ~tracked, axis=1) & tracked.any()
+    offsets = np.zeros(markers.shape[1:])
+    if complete.any():
+        tracked_weights = weights * tracked
+        centroid = np.einsum('fjc,j->fc', positions[complete], tracked_weights) / tracked_weights.sum()
+        offsets[tracked] = (positions[complete][:, tracked] - centroid[:, None, :]).mean(axis=0)
+
+    frame_weights = visible * weights
+    total = frame_weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroid = np.einsum('fjc,fj->fc', positions - offsets, frame_weights) / total[:, None]
+    centroid[total == 0] = np.nan
+    return centroid
@@ -0,0 +1,175 @@
+import itertools
+import warnings
+
+import numpy as np
+
+# Header keys holding integer and float values in a QTM TSV export
+INT_HEADER_KEYS = ('NO_OF_FRAMES', 'NO_OF_CAMERAS', 'NO_OF_MARKERS', 'NO_OF_ANALOG')
+FLOAT_HEADER_KEYS = ('FREQUENCY', 'ANALOG_FREQUENCY')
+# Header keys holding one value per marker
+LIST_HEADER_KEYS = ('MARKER_NAMES', 'TRAJECTORY_TYPES')
+
+
+def _parse_header(file_handle):
+    """
+    Read the QTM header block from an open TSV file.
+
+    Returns the header dictionary, the column offset of the first marker
+    coordinate and the first data line (or None if the file has no data).
+    """
+    header = {}
+    column_names = None
+    for line in file_handle:
+        fields = line.rstrip('\r\n').split('\t')
+        key = fields[0]
+        if key == 'Frame':
+            # Column header row, e.g. "Frame  Time  clav X  clav Y ..."
+            column_names = fields
+            continue
+        if key and (key[0].isdigit() or key[0] == '-'):
+            # First data row reached
+            break
+        if key in INT_HEADER_KEYS:
+            header[key] = int(fields[1])
+        elif key in FLOAT_HEADER_KEYS:
+            header[key] = float(fields[1])
+        elif key in LIST_HEADER_KEYS:
+            header[key] = [name for name in fields[1:] if name]
+        elif key:
+            header[key] = fields[1:]
+    else:
+        line = None
+
+    if 'MARKER_NAMES' not in header:
+        raise ValueError("Invalid QTM TSV file: MARKER_NAMES missing from header.")
+
+    # Locate the first marker coordinate column (after Frame/Time if present)
+    if column_names is not None:
+        first_marker = f"{header['MARKER_NAMES'][0]} X"
+        if first_marker not in column_names:
+            raise ValueError(f"Invalid QTM TSV file: column '{first_marker}' not found.")
+        offset = column_names.index(first_marker)
+    else:
+        offset = 0
+
+    return header, offset, line
+
+
+def read_qtm_header(file_path):
+    """
+    Read only the header block of a QTM TSV export.
+
+    Parameters:
+    - file_path: Path to the TSV file.
+
+    Returns a dictionary with NO_OF_FRAMES, FREQUENCY, MARKER_NAMES,
+    TRAJECTORY_TYPES and the remaining header entries.
+    """
+    with open(file_path, 'r') as f:
+        header, _, _ = _parse_header(f)
+    return header
+
+
+def read_qtm_tsv(file_path, markers=None, dtype=np.float64):
+    """
+    Read selected marker trajectories from a QTM TSV export.
+
+    The header is parsed first so that the output array can be preallocated
+    from NO_OF_FRAMES (it grows if the file has more rows or no
+    NO_OF_FRAMES), and only the columns of the requested markers are
+    decoded, with np.loadtxt(usecols=...).
+
+    Parameters:
+    - file_path: Path to the TSV file.
+    - markers: List of marker names to read (default: all markers).
+    - dtype: Data type of the returned array (e.g., np.float32 or np.float64).
+
+    Returns:
+    - header: Dictionary with the parsed header entries.
+    - data: Array of shape (n_frames, n_markers, 3) with the X, Y, Z
+      coordinates in the units of the export (mm).
+
+    Raises KeyError if a requested marker is not in MARKER_NAMES.
+    """
+    with open(file_path, 'r') as f:
+        header, offset, line = _parse_header(f)
+
+        marker_names = header['MARKER_NAMES']
+        if markers is None:
+            markers = marker_names
+        missing = [name for name in markers if name not in marker_names]
+        if missing:
+            raise KeyError(f"Marker(s) not found in {file_path}: {', '.join(missing)}")
+
+        # Column indices of the X, Y, Z coordinates of each requested marker
+        columns = [offset + 3 * marker_names.index(name) + axis for name in markers for axis in range(3)]
+
+        n_frames = header.get('NO_OF_FRAMES', 0)
+        data = np.empty((n_frames, len(columns)), dtype=dtype)
+        n_read = 0
+        lines = f if line is None else itertools.chain([line], f)
+        while True:
+            if n_read == data.shape[0]:
+                # Skip blank lines to see whether there are more rows than announced in the header
+                line = next(lines, None)
+                while line is not None and not line.strip():
+                    line = next(lines, None)
+                if line is None:
+                    break
+                lines = itertools.chain([line], lines)
+                data = np.concatenate((data, np.empty((max(n_read, 1024), len(columns)), dtype=dtype)))
+            # Decode the requested columns of the rows that fit in the buffer
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)  # raised by loadtxt at the end of the file
+                block = np.loadtxt(lines, dtype=dtype, delimiter='\t', usecols=columns, ndmin=2, max_rows=data.shape[0] - n_read)
+            data[n_read:n_read + len(block)] = block
+            n_read += len(block)
+            if n_read < data.shape[0]:
+                break
+
+    data = data[:n_read].reshape(n_read, len(markers), 3)
+    return header, data
+
+
+def iter_qtm_tsv(file_path, markers=None, chunk_size=1, dtype=np.float64):
+    """
+    Read selected marker trajectories from a QTM TSV export in chunks.
+
+    The file is read line by line, so memory use does not grow with the
+    length of the recording.
+
+    Parameters:
+    - file_path: Path to the TSV file.
+    - markers: List of marker names to read (default: all markers).
+    - chunk_size: Number of frames per chunk.
+    - dtype: Data type of the chunks.
+
+    Yields the header dictionary first, then arrays of shape
+    (n_frames, n_markers, 3) with at most chunk_size frames.
+    """
+    with open(file_path, 'r') as f:
+        header, offset, line = _parse_header(f)
+        yield header
+
+        marker_names = header['MARKER_NAMES']
+        if markers is None:
+            markers = marker_names
+        missing = [name for name in markers if name not in marker_names]
+        if missing:
+            raise KeyError(f"Marker(s) not found in {file_path}: {', '.join(missing)}")
+        columns = [offset + 3 * marker_names.index(name) + axis for name in markers for axis in range(3)]
+        last_column = max(columns) if columns else 0
+
+        chunk = np.empty((chunk_size, len(columns)), dtype=dtype)
+        n_read = 0
+        while line is not None:
+            if line.strip():
+                fields = line.split('\t', last_column + 1)
+                chunk[n_read] = [fields[c] for c in columns]
+                n_read += 1
+                if n_read == chunk_size:
+                    yield chunk.reshape(chunk_size, len(markers), 3).copy()
+                    n_read = 0
+            line = next(f, None)
+        if n_read:
+            yield chunk[:n_read].reshape(n_read, len(markers), 3).copy()
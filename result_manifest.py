@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+
+# Parameters that change the computed speeds; rendering and performance settings are not included
+RESULT_PARAM_KEYS = (
+    'running_direction', 'gate_geometry', 'TIMING_GATE_1_pos', 'TIMING_GATE_2_pos', 'Target_speed', 'Tolerance', 'fs',
+    'gate_timing', 'derivative', 'derivative_options', 'markers', 'marker_set', 'gap_fill', 'donor_markers', 'max_gap'
+)
+
+
+def file_hash(file_path, block_size=1024 ** 2):
+    """
+    Return the SHA-256 hash of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _to_json(value):
+    # NumPy scalars (e.g., np.float64, np.bool_) are not JSON serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    return value
+
+
+def _normalize_numbers(value):
+    # Integral floats hash as integers, so fs=200.0 (e.g., from the command line) and fs=200 give the same hash
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, list):
+        return [_normalize_numbers(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_numbers(v) for k, v in value.items()}
+    return value
+
+
+def params_hash(params, keys=RESULT_PARAM_KEYS):
+    """
+    Return a hash of the parameters that affect the results.
+    """
+    selected = {key: _normalize_numbers(_to_json(params.get(key))) for key in keys}
+    return hashlib.sha256(json.dumps(selected, sort_keys=True).encode()).hexdigest()
+
+
+class ResultManifest:
+    """
+    Record of processed trials for incremental re-runs.
+
+    Each trial is stored under its path relative to the input folder with
+    the hash of its content, the hash of the parameters, its result row and
+    the plots that were saved for it. A trial is only processed again when
+    its data or the parameters changed, or one of its plots is missing.
+
+    File content is only hashed again when the modification time or size of
+    the file changed since the last run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = os.path.dirname(os.path.abspath(path))
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f).get('trials', {})
+            except (ValueError, OSError) as e:
+                print(f"Warning: Ignoring unreadable manifest {path}. {e}")
+
+    def input_hash(self, key, file_path):
+        """
+        Return the content hash of file_path, reusing the stored hash if the file is unchanged on disk.
+        """
+        stat = os.stat(file_path)
+        entry = self.entries.get(key)
+        if entry and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            return entry['input_hash']
+        return file_hash(file_path)
+
+    def lookup(self, key, input_hash, param_hash, artifacts=()):
+        """
+        Return the stored result of a trial, or None if it has to be processed again.
+
+        Parameters:
+        - key: Path of the trial relative to the input folder.
+        - input_hash: Content hash of the trial file.
+        - param_hash: Hash of the current parameters (see params_hash).
+        - artifacts: Paths of the plots expected for this trial.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['input_hash'] != input_hash or entry['params_hash'] != param_hash:
+            return None
+        stored = {os.path.normpath(os.path.join(self.folder, a)) for a in entry['artifacts']}
+        for artifact in artifacts:
+            if os.path.normpath(os.path.abspath(artifact)) not in stored or not os.path.exists(artifact):
+                return None
+        return entry['result']
+
+    def update(self, key, file_path, input_hash, param_hash, result, artifacts=()):
+        """
+        Record the result and plots of a processed trial.
+        """
+        stat = os.stat(file_path)
+        self.entries[key] = {
+            'input_hash': input_hash,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'params_hash': param_hash,
+            'result': _to_json(result),
+            'artifacts': [os.path.relpath(os.path.abspath(a), self.folder) for a in artifacts]
+        }
+
+    def save(self):
+        """
+        Write the manifest; the file is replaced atomically so an interrupted run cannot corrupt it.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'trials': self.entries}, f, indent=1)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,260 @@
+import argparse
+import os
+import sqlite3
+
+RESULTS_DB_NAME = 'results.sqlite'
+
+# Result row keys (as returned by main.process_file) and their column in the store
+RESULT_COLUMNS = {
+    'Mean Speed (m/s)': 'mean_speed',
+    'Valid (Mean Speed)': 'mean_valid',
+    'Distance-Based Speed (m/s)': 'dist_speed',
+    'Valid (Distance-Based Speed)': 'dist_valid',
+    'Gap Frames': 'gap_frames',
+    'Unfilled Gap Frames': 'unfilled_gap_frames',
+    'Target Speed (m/s)': 'target_speed',
+    'Lower Bound (m/s)': 'lower_bound',
+    'Upper Bound (m/s)': 'upper_bound'
+}
+# Every trial is keyed by its path relative to the input folder; subject, condition and trial are indexed columns
+KEY_COLUMNS = ('path', 'subject', 'condition', 'trial')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL PRIMARY KEY,
+    subject TEXT NOT NULL,
+    condition TEXT NOT NULL,
+    trial TEXT NOT NULL,
+    filename TEXT,
+    mean_speed REAL,
+    mean_valid INTEGER,
+    dist_speed REAL,
+    dist_valid INTEGER,
+    gap_frames INTEGER,
+    unfilled_gap_frames INTEGER,
+    target_speed REAL,
+    lower_bound REAL,
+    upper_bound REAL,
+    reference_speed REAL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS results_subject ON results (subject);
+CREATE INDEX IF NOT EXISTS results_condition ON results (condition);
+CREATE INDEX IF NOT EXISTS results_trial ON results (trial);
+"""
+
+
+def trial_keys(file_path, root, store_keys=None):
+    """
+    Return the (path, subject, condition, trial) of a trial file.
+
+    Parameters:
+    - file_path: Path of the trial file.
+    - root: Input folder; the path (the key of the trial) is relative to it, with '/' separators.
+    - store_keys: Folders of the relative path used as subject and condition,
+      e.g. {'subject': 0, 'condition': 2} for Data/<subject>/<session>/<condition>/<trial>.tsv
+      (negative indices count from the file). None uses the two folders above
+      the file, as in the subject/condition trees of the data
+      (e.g. FP01/pref_speed/Running_PREF 5.tsv).
+
+    The trial is the file name without extension.
+    """
+    path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(root)).replace(os.sep, '/')
+    trial = os.path.splitext(os.path.basename(file_path))[0]
+    if store_keys is None:
+        folder = os.path.dirname(os.path.abspath(file_path))
+        return path, os.path.basename(os.path.dirname(folder)), os.path.basename(folder), trial
+
+    folders = path.split('/')[:-1]
+
+    def folder_at(level):
+        return folders[level] if -len(folders) <= level < len(folders) else ''
+
+    return path, folder_at(store_keys['subject']), folder_at(store_keys['condition']), trial
+
+
+def check_unique_keys(keys):
+    """
+    Raise a ValueError if two trials have the same path key (see trial_keys).
+    """
+    seen = set()
+    duplicates = sorted({key[0] for key in keys if key[0] in seen or seen.add(key[0])})
+    if duplicates:
+        raise ValueError(f"Several trials map to the same key in the results store: {', '.join(duplicates)}.")
+
+
+def _to_sql(value):
+    # NumPy scalars (e.g., np.float64, np.bool_) are stored as Python numbers
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class ResultStore:
+    """
+    SQLite store of the per-trial results, keyed by the path of the trial
+    relative to the input folder and indexed on subject, condition and trial.
+
+    Every row is committed as soon as it is appended, so the results of a
+    batch are kept up to the trial where it stopped. Appending a trial that
+    is already in the store replaces its computed values; its reference
+    (timing gate) speed is kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+        if columns and 'path' not in columns:
+            # Stores keyed only by subject, condition and trial mixed up trials of different
+            # folders; keep their rows in results_legacy and start a new table
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS results_legacy")
+                self.connection.execute("ALTER TABLE results RENAME TO results_legacy")
+                for index in ('results_subject', 'results_condition', 'results_trial'):
+                    self.connection.execute(f"DROP INDEX IF EXISTS {index}")
+            print(f"Moved the rows of the old results table of {path} to results_legacy.")
+        self.connection.executescript(_SCHEMA)
+
+    def append(self, rows):
+        """
+        Insert or update result rows and commit them.
+
+        Parameters:
+        - rows: List of (path, subject, condition, trial, result) tuples (see
+          trial_keys), where result is a result dictionary as returned by main.process_file (including the
+          target speed and bounds).
+        """
+        columns = list(KEY_COLUMNS) + ['filename'] + list(RESULT_COLUMNS.values())
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns[1:])
+        statement = (
+            f"INSERT INTO results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (path) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP"
+        )
+        values = [
+            tuple(keys) + (result.get('Filename'),)
+            + tuple(_to_sql(result.get(key)) for key in RESULT_COLUMNS)
+            for *keys, result in rows
+        ]
+        with self.connection:
+            self.connection.executemany(statement, values)
+
+    def set_reference_speeds(self, rows):
+        """
+        Set the reference (IR timing gate) speed of trials that are in the store.
+
+        Parameters:
+        - rows: List of (path, speed) tuples.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE results SET reference_speed = ? WHERE path = ?",
+                [(_to_sql(speed), path) for path, speed in rows]
+            )
+
+    def _query(self, columns, subject=None, condition=None, trial=None, prefix=None):
+        filters = {'subject = ?': subject, 'condition = ?': condition, 'trial = ?': trial, 'instr(path, ?) = 1': prefix}
+        where = [clause for clause, value in filters.items() if value is not None]
+        query = f"SELECT {columns} FROM results"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return query + " ORDER BY path", [value for value in filters.values() if value is not None]
+
+    def paths(self, subject=None, condition=None, trial=None, prefix=None):
+        """
+        Return the paths of the stored trials in sorted order, optionally filtered (see read).
+        """
+        query, values = self._query('path', subject, condition, trial, prefix)
+        return [row[0] for row in self.connection.execute(query, values)]
+
+    def read(self, subject=None, condition=None, trial=None, prefix=None):
+        """
+        Return the stored results as a DataFrame sorted by path, optionally filtered
+        on subject, condition, trial and the start of the path (prefix, e.g. 'tracked_data/').
+        """
+        query, values = self._query('*', subject, condition, trial, prefix)
+        # pandas is only imported when results are read, which keeps the start of short runs fast
+        import pandas as pd
+        return pd.read_sql_query(query, self.connection, params=values)
+
+    def export_excel(self, excel_path, subject=None, condition=None, prefix=None):
+        """
+        Export the stored results (optionally of one subject, condition or path prefix) to an Excel file.
+        """
+        df = self.read(subject, condition, prefix=prefix)
+        columns = {v: k for k, v in RESULT_COLUMNS.items()}
+        columns.update({'filename': 'Filename', 'reference_speed': 'IR Timing Gates (m/s)'})
+        df = df.rename(columns=columns)
+        df.to_excel(excel_path, index=False)
+        print(f"Results exported to {excel_path}")
+
+    def close(self):
+        self.connection.close()
+
+
+def import_reference_speeds(store, table_path, subject=None, condition=None, prefix=None, filename_column=None, speed_column='IR timing gates'):
+    """
+    Read IR timing gate speeds from an Excel or CSV table with one row per
+    trial, and store them as the reference speeds of trials in the store.
+
+    The trials are those of subject, condition and path prefix (all optional).
+    With filename_column, every row is matched to the trial with that file
+    name. Without it, the rows are matched by position to the trials in the
+    order of their paths (the order in which main.py processes them), as in
+    results/speed_comparison_*_bland_altman.xlsx; the table must then have
+    exactly one row per trial.
+
+    Returns the number of imported trials.
+    """
+    import pandas as pd
+    if table_path.lower().endswith('.csv'):
+        table = pd.read_csv(table_path)
+    else:
+        table = pd.read_excel(table_path)
+    paths = store.paths(subject, condition, prefix=prefix)
+
+    if filename_column is None:
+        speeds = table[speed_column]
+        if len(speeds) != len(paths):
+            raise ValueError(f"{table_path} has {len(speeds)} rows, but {len(paths)} trials in the store match "
+                             f"(subject={subject}, condition={condition}, prefix={prefix}).")
+        rows = [(path, float(speed)) for path, speed in zip(paths, speeds) if pd.notna(speed)]
+    else:
+        by_trial = {}
+        for path in paths:
+            by_trial.setdefault(os.path.splitext(path.rsplit('/', 1)[-1])[0], []).append(path)
+        rows = []
+        table = table[[filename_column, speed_column]].dropna()
+        for filename, speed in zip(table[filename_column], table[speed_column]):
+            matches = by_trial.get(os.path.splitext(str(filename))[0], [])
+            if len(matches) != 1:
+                raise ValueError(f"Trial '{filename}' matches {len(matches)} trials in the store; narrow it down with subject, condition or prefix.")
+            rows.append((matches[0], float(speed)))
+    store.set_reference_speeds(rows)
+    return len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import reference speeds into, or export Excel files from, the results store.")
+    parser.add_argument('store', help=f"Path of the results store ({RESULTS_DB_NAME} in the output folder)")
+    parser.add_argument('--subject', help="Only this subject (e.g. FP01)")
+    parser.add_argument('--condition', help="Only this condition (e.g. pref_speed)")
+    parser.add_argument('--prefix', help="Only trials whose path starts with this prefix (e.g. tracked_data/)")
+    parser.add_argument('--import-reference', metavar='TABLE', help="Excel or CSV table with the IR timing gate speed of every trial")
+    parser.add_argument('--filename-column', help="Column of the table with the trial file names (default: match the rows by position, in the order of the trial paths)")
+    parser.add_argument('--speed-column', default='IR timing gates', help="Column of the table with the IR timing gate speeds")
+    parser.add_argument('--export', metavar='XLSX', help="Export the (filtered) results to this Excel file")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    if args.import_reference:
+        n = import_reference_speeds(store, args.import_reference, args.subject, args.condition, args.prefix, args.filename_column, args.speed_column)
+        print(f"Imported {n} reference speeds into {args.store}")
+    if args.export:
+        store.export_excel(args.export, args.subject, args.condition, args.prefix)
+    store.close()
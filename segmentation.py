@@ -0,0 +1,132 @@
+import numpy as np
+
+from gate_geometry import project_run_axis, gate_positions
+from vtg_dist import CROSSING_METHODS, find_gate_crossing
+
+# Direction labels of a pass: from Timing Gate 1 to Timing Gate 2 (the running direction of a trial) or back
+DIRECTIONS = ('gate_1_to_gate_2', 'gate_2_to_gate_1')
+
+
+def _runs(zone, valid):
+    # First and last sample of every run of equal zones, skipping invalid (NaN) samples
+    indices = np.flatnonzero(valid)
+    if len(indices) == 0:
+        return np.empty(0, dtype=int), indices, indices
+    zone = zone[indices]
+    change = np.flatnonzero(np.diff(zone) != 0) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change - 1, [len(zone) - 1]))
+    return zone[starts], indices[starts], indices[ends]
+
+
+def _crossing(q, q_gate, before, after, method):
+    # Fractional index where q passes q_gate between samples before and after (one per pass)
+    crossing = before + (q_gate - q[before]) / (q[after] - q[before]) * (after - before)
+    if method == 'cubic':
+        for k in np.flatnonzero(after - before == 1):
+            lo, hi = max(before[k] - 2, 0), min(after[k] + 3, len(q))
+            window = q[lo:hi]
+            if not np.isnan(window).any():
+                crossing[k] = lo + find_gate_crossing(window, q_gate, 'cubic')
+    return crossing
+
+
+def find_gate_passes(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, crossing='sample'):
+    """
+    Find and time every pass through both timing gates in a long recording.
+
+    Every sample is labelled by its zone on the run coordinate: beyond
+    Timing Gate 1, between the gates, or beyond Timing Gate 2 (NaN samples
+    are skipped). A pass is a run of samples between the gates entered from
+    one side and left on the other side, found with vectorized sign-change
+    detection in linear time. Runs that return to the side they came from
+    (a turnaround between the gates) are not passes.
+
+    Parameters are those of v_t_g_dist_compute. With crossing 'sample' a
+    pass is timed from its first to its last sample between the gates, as
+    v_t_g_dist_compute does for a single pass; 'linear' and 'cubic'
+    interpolate the crossing times between samples.
+
+    Returns a dictionary of arrays with one entry per pass, in the order of the recording:
+    - start_index, end_index: (Fractional) sample indices at which the pass enters and leaves the gates.
+    - start_time: Time of the entry in seconds from the start of the recording.
+    - time_between_gates: Duration of the pass in seconds.
+    - speed: Distance between the gates divided by time_between_gates (m/s).
+    - direction: 'gate_1_to_gate_2' or 'gate_2_to_gate_1' (see DIRECTIONS).
+    - is_valid: Whether the speed is within Tolerance percent of Target_speed.
+    - gap_frames: Number of NaN samples within the pass.
+    and the scalars Target_speed, lower_bound and upper_bound.
+    """
+    if crossing not in CROSSING_METHODS:
+        raise ValueError(f"Invalid crossing method. Use one of {', '.join(CROSSING_METHODS)}.")
+
+    Pos_all = project_run_axis(test_marker, running_direction)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+    distance_between_gates = abs(TIMING_GATE_1_pos - TIMING_GATE_2_pos)
+
+    # Orient the run coordinate so that gate 1 is above gate 2
+    sign = 1.0 if TIMING_GATE_1_pos > TIMING_GATE_2_pos else -1.0
+    q = sign * Pos_all
+    q_1, q_2 = sign * TIMING_GATE_1_pos, sign * TIMING_GATE_2_pos
+
+    # Zone 0: at or beyond gate 1, 1: between the gates, 2: at or beyond gate 2
+    valid = ~np.isnan(q)
+    zone = np.where(q >= q_1, 0, np.where(q > q_2, 1, 2))
+    run_zone, run_start, run_end = _runs(zone, valid)
+
+    # Passes with samples between the gates (0, 1, 2 or 2, 1, 0) ...
+    middle = np.flatnonzero((run_zone[1:-1] == 1) & (run_zone[:-2] != run_zone[2:])) + 1
+    # ... and, for interpolated crossings, passes between two consecutive samples (0, 2 or 2, 0);
+    # a jump across a gap in the data is not a pass
+    if crossing == 'sample':
+        jump = np.empty(0, dtype=int)
+    else:
+        jump = np.flatnonzero((np.abs(np.diff(run_zone)) == 2) & (run_start[1:] - run_end[:-1] == 1))
+
+    forward = np.concatenate((run_zone[middle - 1] == 0, run_zone[jump] == 0))
+    if crossing == 'sample':
+        start_index = run_start[middle].astype(np.float64)
+        end_index = run_end[middle].astype(np.float64)
+    else:
+        # Samples before and after each gate crossing
+        entry_before = np.concatenate((run_end[middle - 1], run_end[jump]))
+        entry_after = np.concatenate((run_start[middle], run_start[jump + 1]))
+        exit_before = np.concatenate((run_end[middle], run_end[jump]))
+        exit_after = np.concatenate((run_start[middle + 1], run_start[jump + 1]))
+        entry_gate = np.where(forward, q_1, q_2)
+        exit_gate = np.where(forward, q_2, q_1)
+        start_index = np.empty(len(forward))
+        end_index = np.empty(len(forward))
+        for gate in (q_1, q_2):
+            entering = entry_gate == gate
+            leaving = exit_gate == gate
+            start_index[entering] = _crossing(q, gate, entry_before[entering], entry_after[entering], crossing)
+            end_index[leaving] = _crossing(q, gate, exit_before[leaving], exit_after[leaving], crossing)
+
+    order = np.argsort(start_index, kind='stable')
+    start_index, end_index, forward = start_index[order], end_index[order], forward[order]
+
+    time_between_gates = (end_index - start_index) / fs
+    with np.errstate(divide='ignore'):
+        speed = distance_between_gates / time_between_gates
+
+    lower_bound = Target_speed * (1 - Tolerance / 100)
+    upper_bound = Target_speed * (1 + Tolerance / 100)
+
+    # NaN samples within every pass, from the cumulative count of NaN samples
+    gaps = np.concatenate(([0], np.cumsum(~valid)))
+    gap_frames = gaps[np.floor(end_index).astype(int) + 1] - gaps[np.ceil(start_index).astype(int)]
+
+    return {
+        'start_index': start_index,
+        'end_index': end_index,
+        'start_time': start_index / fs,
+        'time_between_gates': time_between_gates,
+        'speed': speed,
+        'direction': np.where(forward, DIRECTIONS[0], DIRECTIONS[1]),
+        'is_valid': (speed >= lower_bound) & (speed <= upper_bound),
+        'gap_frames': gap_frames,
+        'Target_speed': Target_speed,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound
+    }
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from gate_geometry import gate_positions
+from vtg_dist import v_t_g_dist_compute
+from vtg_speed import v_t_g_compute
+
+
+def run_towards_positive_y(speed=4.0, fs=200):
+    # Midpoint running from y = -2 m to y = 3 m, as in a trial with running_direction '-y'
+    y = np.arange(-2.0, 3.0, speed / fs)
+    return np.column_stack((np.full(len(y), 0.9), y, np.full(len(y), 0.95)))
+
+
+@pytest.mark.parametrize('compute', [v_t_g_compute, v_t_g_dist_compute])
+def test_gates_in_wrong_order_for_mirrored_direction(compute):
+    with pytest.raises(ValueError, match=r"'-y'.*smaller y coordinate.*-0\.5 and 1\.7"):
+        compute(run_towards_positive_y(), '-y', 1.7, -0.5, 4.0, 10, 200)
+
+
+def test_gates_in_lab_coordinates_for_mirrored_direction():
+    assert gate_positions('-y', -0.5, 1.7) == (0.5, -1.7)
+    result = v_t_g_dist_compute(run_towards_positive_y(), '-y', -0.5, 1.7, 4.0, 10, 200)
+    assert np.isclose(result['speed'], 4.0, rtol=0.01)
+    with pytest.raises(ValueError, match=r"larger x coordinate"):
+        gate_positions('x', -0.5, 1.7)
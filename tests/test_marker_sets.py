@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from gap_fill import reconstruct_markers
+from marker_sets import MARKER_SETS, missing_markers, resolve_marker_set, segment_donors
+
+
+def rotation_x(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+
+
+def running_com_markers(n_frames=400, fs=200, seed=0):
+    # Every segment of the 'com' set is a rigid body; the legs swing relative to the trunk
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_frames) / fs
+    names, markers = [], []
+    for k, (segment, (_, segment_markers)) in enumerate(MARKER_SETS['com'].items()):
+        offsets = rng.uniform(-80, 80, (len(segment_markers), 3))
+        angles = np.zeros(n_frames) if segment == 'head_arms_trunk' else 0.6 * np.sin(2 * np.pi * 1.4 * t + k)
+        rotations = np.stack([rotation_x(angle) for angle in angles])
+        hip = np.column_stack((np.full(n_frames, 900.0), 4000 * t, np.full(n_frames, 950.0)))
+        for offset in offsets:
+            markers.append(hip + np.einsum('fij,j->fi', rotations, offset + [0, 0, -400]))
+        names += segment_markers
+    return np.stack(markers, axis=1), names
+
+
+def test_segment_donors_stay_within_segment():
+    donors = segment_donors('com', ['SIAS_left', 'SIAS_right', 'becken_top_left', 'becken_top_right'])
+    foot = MARKER_SETS['com']['foot_left'][1]
+    assert set(donors['toe_left']) == set(foot) - {'toe_left'}
+    # Pelvis-only segments also use the donor markers
+    pelvis_donors = segment_donors('sips_midpoint', ['SIAS_left', 'SIAS_right'])
+    assert pelvis_donors['SIPS_left'] == ['SIPS_right', 'SIAS_left', 'SIAS_right']
+
+
+def test_distal_gap_is_filled_from_its_own_segment():
+    markers, names = running_com_markers()
+    toe = names.index('toe_left')
+    expected = markers[100:130, toe].copy()
+    markers[100:130, toe] = 0.0
+
+    filled, _ = reconstruct_markers(markers, names, names, 'linear', segment_donors('com'))
+    whole_body, _ = reconstruct_markers(markers, names, names, 'linear', names)
+
+    segment_error = np.abs(filled[100:130, toe] - expected).max()
+    whole_body_error = np.abs(whole_body[100:130, toe] - expected).max()
+    assert segment_error < 1e-6
+    assert whole_body_error > 10
+
+
+def test_segment_keeps_its_weight_with_missing_markers():
+    shank = MARKER_SETS['com']['shank_right'][1]
+    feet = MARKER_SETS['com']['foot_left'][1] + MARKER_SETS['com']['foot_right'][1]
+    available = [name for _, markers in MARKER_SETS['com'].values() for name in markers
+                 if name not in shank[2:] and name not in feet]
+    names, weights = resolve_marker_set('com', available)
+    weights = dict(zip(names, weights))
+
+    # shank_right keeps its share of the mass, the feet are left out and the rest is rescaled
+    total = 1 - 2 * 0.0137
+    assert np.isclose(weights[shank[0]] + weights[shank[1]], 0.0433 / total)
+    assert np.isclose(sum(weights[name] for name in MARKER_SETS['com']['shank_left'][1]), 0.0433 / total)
+    assert missing_markers('com', available) == (['foot_left', 'foot_right'], shank[2:])
+
+
+def test_marker_set_without_markers_in_file():
+    with pytest.raises(KeyError):
+        resolve_marker_set('trunk', ['SIPS_left', 'SIPS_right'])
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from qtm_reader import read_qtm_tsv
+
+MARKERS = ['SIPS_left', 'SIPS_right', 'toe_left']
+
+
+def write_tsv(path, n_frames, header_frames=None):
+    # Minimal QTM export with three markers; NO_OF_FRAMES is left out if header_frames is None
+    data = np.arange(n_frames * 9, dtype=np.float64).reshape(n_frames, 9) / 8
+    with open(path, 'w') as f:
+        if header_frames is not None:
+            f.write(f"NO_OF_FRAMES\t{header_frames}\n")
+        f.write("FREQUENCY\t200\n")
+        f.write("MARKER_NAMES\t" + "\t".join(MARKERS) + "\n")
+        f.write("Frame\tTime\t" + "\t".join(f"{name} {axis}" for name in MARKERS for axis in 'XYZ') + "\n")
+        for i, row in enumerate(data):
+            f.write(f"{i + 1}\t{i / 200:.3f}\t" + "\t".join(f"{value:.3f}" for value in row) + "\n")
+        f.write("\n")
+    return data.reshape(n_frames, 3, 3)
+
+
+@pytest.mark.parametrize('header_frames', [None, 0, 3, 1500])
+def test_rows_not_announced_in_header(tmp_path, header_frames):
+    path = tmp_path / 'trial.tsv'
+    expected = write_tsv(path, 1500, header_frames)
+    header, data = read_qtm_tsv(str(path), ['toe_left', 'SIPS_left'])
+    assert data.shape == (1500, 2, 3)
+    np.testing.assert_array_equal(data, expected[:, [2, 0]])
+
+
+def test_header_without_data_rows(tmp_path):
+    path = tmp_path / 'trial.tsv'
+    write_tsv(path, 0)
+    header, data = read_qtm_tsv(str(path), MARKERS, dtype=np.float32)
+    assert data.shape == (0, 3, 3)
+    assert data.dtype == np.float32
@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from qtm_reader import read_qtm_tsv
+
+# A stored trial is a marker-major array <name>.npy of shape (n_markers, n_frames, 3),
+# so every marker is contiguous on disk, and its header in <name>.meta.json
+STORE_EXTENSION = '.npy'
+META_EXTENSION = '.meta.json'
+
+
+def _meta_path(store_path):
+    return os.path.splitext(store_path)[0] + META_EXTENSION
+
+
+def write_trial(store_path, header, data, dtype=np.float64):
+    """
+    Write a trial to the binary store.
+
+    Parameters:
+    - store_path: Path of the .npy file to write.
+    - header: Header dictionary (NO_OF_FRAMES, FREQUENCY, MARKER_NAMES, TRAJECTORY_TYPES, ...).
+    - data: Array of shape (n_frames, n_markers, 3) with all markers of MARKER_NAMES.
+    - dtype: Data type of the stored coordinates.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    np.save(store_path, np.ascontiguousarray(data.transpose(1, 0, 2), dtype=dtype))
+    with open(_meta_path(store_path), 'w') as f:
+        json.dump(header, f, indent=1)
+
+
+def read_store_header(store_path):
+    """
+    Read the header of a stored trial.
+    """
+    with open(_meta_path(store_path), 'r') as f:
+        return json.load(f)
+
+
+def read_store(store_path, markers=None):
+    """
+    Read selected markers of a stored trial.
+
+    The array is opened with np.memmap, so only the pages of the requested
+    markers are read from disk. Same interface as qtm_reader.read_qtm_tsv.
+
+    Parameters:
+    - store_path: Path of the .npy file.
+    - markers: List of marker names to read (default: all markers).
+
+    Returns the header dictionary and an array of shape (n_frames, n_markers, 3).
+    Raises KeyError if a requested marker is not in MARKER_NAMES.
+    """
+    header = read_store_header(store_path)
+    marker_names = header['MARKER_NAMES']
+    if markers is None:
+        markers = marker_names
+    missing = [name for name in markers if name not in marker_names]
+    if missing:
+        raise KeyError(f"Marker(s) not found in {store_path}: {', '.join(missing)}")
+
+    stored = np.load(store_path, mmap_mode='r')
+    indices = [marker_names.index(name) for name in markers]
+    data = np.stack([stored[i] for i in indices], axis=1) if indices else np.empty((stored.shape[1], 0, 3))
+    return header, data
+
+
+def ingest_file(source_path, store_path, dtype=np.float64):
+    """
+    Convert a single QTM TSV export or C3D file to the binary store.
+    """
+    if source_path.lower().endswith('.c3d'):
+        from c3d_reader import read_c3d
+        header, data = read_c3d(source_path)
+    else:
+        header, data = read_qtm_tsv(source_path)
+    write_trial(store_path, header, data, dtype)
+
+
+def ingest_folder(source_root, store_root, recursive=True, dtype=np.float64, force=False, extensions=('.tsv', '.c3d')):
+    """
+    Convert all TSV exports and C3D files below source_root to the binary store in store_root.
+
+    The folder structure is mirrored in store_root. Trials whose store file
+    is newer than the source are skipped unless force is set. If a folder
+    holds both a TSV and a C3D file of the same trial, the first one in
+    sorted order (the C3D file) is stored.
+
+    Returns the list of written store paths.
+    """
+    from batch_runner import find_trial_files
+
+    written = []
+    seen = set()
+    for source_path in find_trial_files(source_root, tuple(extensions), recursive):
+        relative_path = os.path.relpath(source_path, source_root)
+        store_path = os.path.join(store_root, os.path.splitext(relative_path)[0] + STORE_EXTENSION)
+        if store_path in seen:
+            print(f"Warning: Skipping {relative_path}, the trial is already stored from another format.")
+            continue
+        seen.add(store_path)
+        if (not force and os.path.exists(store_path) and os.path.exists(_meta_path(store_path))
+                and os.path.getmtime(store_path) >= os.path.getmtime(source_path)):
+            continue
+        try:
+            ingest_file(source_path, store_path, dtype)
+        except Exception as e:
+            print(f"Error: Failed to ingest {source_path}. {e}")
+            continue
+        print(f"Ingested {relative_path}")
+        written.append(store_path)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert QTM TSV exports and C3D files to a memory-mapped binary trajectory store.")
+    parser.add_argument('source', help="Folder with the TSV and C3D files (searched recursively)")
+    parser.add_argument('store', help="Output folder of the binary store")
+    parser.add_argument('--float32', action='store_true', help="Store coordinates as float32 instead of float64")
+    parser.add_argument('--force', action='store_true', help="Convert all files, also those that are up to date")
+    args = parser.parse_args()
+    written = ingest_folder(args.source, args.store, dtype=np.float32 if args.float32 else np.float64, force=args.force)
+    print(f"Ingested {len(written)} files into {args.store}")
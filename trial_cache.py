@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict, namedtuple
+
+from qtm_reader import read_qtm_header, read_qtm_tsv
+from trajectory_store import STORE_EXTENSION, read_store_header, read_store
+from c3d_reader import read_c3d_header, read_c3d
+from gap_fill import detect_gaps, reconstruct_markers
+from instrumentation import TrialMetrics
+from marker_sets import resolve_marker_set, missing_markers, segment_centroid
+
+# Header and marker readers by file extension; all readers return arrays of shape (n_frames, n_markers, 3) in mm
+READERS = {
+    '.tsv': (read_qtm_header, read_qtm_tsv),
+    '.c3d': (read_c3d_header, read_c3d),
+    STORE_EXTENSION: (read_store_header, read_store),
+}
+
+# A parsed trial: QTM header, marker array (mm) with the names of its markers,
+# midpoint trajectory (m) and gap report of the midpoint markers (None without gap filling)
+Trial = namedtuple('Trial', ['header', 'markers', 'marker_names', 'midpoint', 'gaps'])
+
+
+def get_readers(file_path):
+    """
+    Return the header and marker reader for the format of file_path.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported trial format '{extension}'. Use one of {', '.join(READERS)}.")
+    return READERS[extension]
+
+
+def compute_midpoint(markers):
+    """
+    Compute the midpoint trajectory of the markers and convert it to meters.
+
+    Parameters:
+    - markers: Array of shape (n_frames, n_markers, 3) in mm.
+
+    Returns an array of shape (n_frames, 3) in meters.
+    """
+    return markers.mean(axis=1) / 1000
+
+
+class TrialCache:
+    """
+    In-memory LRU cache of parsed trials.
+
+    Trials are read from QTM TSV exports, C3D files or the binary trajectory store
+    (see READERS). Entries are keyed by file path, modification time, file size and the
+    requested markers, so an edited or re-exported file is parsed again.
+    The least recently used trials are evicted once the cached arrays
+    exceed max_bytes.
+
+    With gap_fill set to 'linear' or 'cubic', gaps in the markers are
+    reconstructed (see gap_fill.reconstruct_markers) before the midpoint is
+    computed; donor_markers found in the file are loaded as well and used,
+    together with the other requested markers, for the rigid-body fill. With
+    donors ({marker: [donors]}, see marker_sets.segment_donors), every marker
+    is only filled from its own donors. With gap_fill 'off' the markers are used as exported.
+
+    With a marker_set (see marker_sets.resolve_marker_set), the midpoint is
+    the weighted centroid of its markers (marker_sets.segment_centroid),
+    which falls back to the visible markers in frames where markers are
+    missing. The weight of a segment is shared by its markers in the file;
+    markers and segments that are not in a file are reported.
+    """
+
+    def __init__(self, markers, max_bytes=512 * 1024 ** 2, gap_fill='off', donor_markers=(), max_gap=None, marker_set=None, donors=None):
+        self.markers = list(markers)
+        self.marker_set = marker_set
+        self.max_bytes = max_bytes
+        self.gap_fill = gap_fill
+        self.donor_markers = [name for name in donor_markers if name not in self.markers]
+        self.donors = donors
+        self.max_gap = max_gap
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def _key(self, file_path):
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, tuple(self.markers), repr(self.marker_set))
+
+    def _midpoint(self, markers, weights):
+        if weights is None:
+            return compute_midpoint(markers)
+        return segment_centroid(markers, weights, detect_gaps(markers)) / 1000
+
+    def _load(self, file_path, metrics):
+        read_header, read_markers = get_readers(file_path)
+        targets = list(self.markers)
+        weights = None
+        with metrics.timer('read'):
+            if self.marker_set is not None or self.gap_fill != 'off':
+                available = read_header(file_path)['MARKER_NAMES']
+            if self.marker_set is not None:
+                # Share the weight of every segment among its markers in this file
+                targets, weights = resolve_marker_set(self.marker_set, available)
+            marker_names = targets
+            if self.gap_fill != 'off':
+                # Load the donor markers that are present in this file
+                marker_names = targets + [name for name in self.donor_markers if name in available and name not in targets]
+            header, markers = read_markers(file_path, marker_names)
+
+        if self.marker_set is not None:
+            filename = os.path.basename(file_path)
+            empty, absent = missing_markers(self.marker_set, available)
+            if empty:
+                print(f"Warning: No markers of {', '.join(empty)} in {filename}; the centroid is computed without these segments.")
+            if absent:
+                print(f"Warning: {', '.join(absent)} not in {filename}; their weight is shared by the other markers of their segment.")
+
+        gaps = None
+        if self.gap_fill != 'off':
+            with metrics.timer('gap_fill'):
+                donors = marker_names if self.donors is None else self.donors
+                markers, gaps = reconstruct_markers(markers, marker_names, targets, self.gap_fill, donors, self.max_gap)
+        with metrics.timer('midpoint'):
+            midpoint = self._midpoint(markers[:, :len(targets)], weights)
+        return header, markers, marker_names, midpoint, gaps
+
+    def get(self, file_path, metrics=None):
+        """
+        Return the Trial for file_path, parsing the file only on a cache miss.
+
+        On a miss, the optional instrumentation.TrialMetrics times reading the
+        file ('read'), the gap filling ('gap_fill') and the midpoint ('midpoint').
+        """
+        if metrics is None:
+            metrics = TrialMetrics(file_path)
+        key = self._key(file_path)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        # Drop stale entries of a file that changed on disk
+        for stale_key in [k for k in self._entries if k[0] == key[0]]:
+            self._remove(stale_key)
+
+        header, markers, marker_names, midpoint, gaps = self._load(file_path, metrics)
+        # Cached arrays are shared between stages, so protect them from in-place edits
+        markers.setflags(write=False)
+        midpoint.setflags(write=False)
+        trial = Trial(header, markers, marker_names, midpoint, gaps)
+
+        self._entries[key] = trial
+        self.nbytes += markers.nbytes + midpoint.nbytes
+        self._evict()
+        return trial
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the bound
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        trial = self._entries.pop(key)
+        self.nbytes -= trial.markers.nbytes + trial.midpoint.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
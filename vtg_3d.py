@@ -1,29 +1,36 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from gate_geometry import VERTICAL, project_run_axis, gate_positions, gate_planes
 
 
 def plot_3d(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, plot_figure, save_path=None):
     """
     Function to calculate trajectory path and show virtual timing gates.
     """
+    from vtg_render import get_pyplot
+    plt = get_pyplot(plot_figure)
+
+    # Position of every sample along the running direction
+    Pos_all = project_run_axis(test_marker, running_direction)
+    planes = gate_planes(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
 
     # Adjust the range to include 0.5 meters before the timing gates
     start_rec = TIMING_GATE_1_pos + 0.5  # Extend upper limit
     stop_rec = TIMING_GATE_2_pos - 0.5  # Extend lower limit
 
     # Filter the test_marker data to be within start_rec and stop_rec
-    filtered_indices = np.where((test_marker[:, 1] >= stop_rec) & (test_marker[:, 1] <= start_rec))[0]
+    filtered_indices = np.where((Pos_all >= stop_rec) & (Pos_all <= start_rec))[0]
     if len(filtered_indices) == 0:
         raise ValueError("No data points found within the timing gate range.")
     test_marker = test_marker[filtered_indices]
+    Pos_all = Pos_all[filtered_indices]
 
     # Find indices within the range of the timing gates
-    index_within_range = np.where((test_marker[:, 1] > TIMING_GATE_2_pos) & (test_marker[:, 1] < TIMING_GATE_1_pos))[0]
+    index_within_range = np.where((Pos_all > TIMING_GATE_2_pos) & (Pos_all < TIMING_GATE_1_pos))[0]
     if len(index_within_range) == 0:
         raise ValueError("No data points found within the timing gate range for plotting.")
 
-    Pos_data = test_marker[index_within_range, 1]
-
     # Plot a 3D coordinate system
     origin = [0, 0, 0]
     x_axis = [1, 0, 0]
@@ -48,18 +55,17 @@ def plot_3d(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos
     # Rotate the figure by 90 degrees
     ax.view_init(elev=45, azim=45)  # Set elevation to 90 degrees and azimuth to 0 degrees
 
-    # Plot Timing Gate 1 as a plane
-    x = np.linspace(-0.5, 1.5, 10)
-    z = np.linspace(0, 2, 10)
-    X, Z = np.meshgrid(x, z)
-    Y1 = np.full_like(X, TIMING_GATE_1_pos)
-    ax.plot_surface(X, Y1, Z, alpha=0.5, color='gray', edgecolor='none')
-    ax.text(0, TIMING_GATE_1_pos, 2.5, 'Timing Gate 1', horizontalalignment='center', fontsize=8)
-
-    # Plot Timing Gate 2 as a plane
-    Y2 = np.full_like(X, TIMING_GATE_2_pos)
-    ax.plot_surface(X, Y2, Z, alpha=0.5, color='gray', edgecolor='none')
-    ax.text(0, TIMING_GATE_2_pos, 2.5, 'Timing Gate 2', horizontalalignment='center', fontsize=8)
+    # Plot the timing gates as 2 m wide and 2 m high planes, centered on the trajectory
+    a, b = np.meshgrid(np.linspace(-1, 1, 10), np.linspace(0, 2, 10))
+    trajectory_center = test_marker.mean(axis=0)
+    for gate_number, (point, normal) in enumerate(planes, start=1):
+        width = np.cross(VERTICAL, normal)
+        width = width / np.linalg.norm(width) if np.linalg.norm(width) > 0 else np.array([1.0, 0.0, 0.0])
+        center = point + np.dot(trajectory_center - point, width) * width
+        center[2] = 0
+        X, Y, Z = (center[:, None, None] + a * width[:, None, None] + b * VERTICAL[:, None, None])
+        ax.plot_surface(X, Y, Z, alpha=0.5, color='gray', edgecolor='none')
+        ax.text(center[0], center[1], 2.5, f'Timing Gate {gate_number}', horizontalalignment='center', fontsize=8)
 
     # Scatter plot for test_marker points
     ax.scatter(test_marker[:, 0], test_marker[:, 1], test_marker[:, 2], c='k', marker='o')
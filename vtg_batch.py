@@ -0,0 +1,155 @@
+import numpy as np
+
+from gate_geometry import project_run_axis, gate_positions
+
+
+def stack_trials(trials):
+    """
+    Concatenate trials into one flat buffer.
+
+    Parameters:
+    - trials: List of arrays of shape (n_frames_i, 3).
+
+    Returns:
+    - buffer: Array of shape (sum(n_frames_i), 3).
+    - offsets: Array of length n_trials + 1; trial i is buffer[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.array([len(trial) for trial in trials], dtype=np.int64)
+    offsets = np.zeros(len(trials) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if len(trials) == 0:
+        return np.empty((0, 3)), offsets
+    return np.concatenate(trials, axis=0), offsets
+
+
+def pad_trials(trials, fill_value=np.nan):
+    """
+    Stack trials into a padded array.
+
+    Parameters:
+    - trials: List of arrays of shape (n_frames_i, 3).
+    - fill_value: Value of the padding samples.
+
+    Returns:
+    - padded: Array of shape (n_trials, max(n_frames_i), 3).
+    - lengths: Number of valid frames of each trial.
+    """
+    lengths = np.array([len(trial) for trial in trials], dtype=np.int64)
+    padded = np.full((len(trials), lengths.max(initial=0), 3), fill_value, dtype=np.float64)
+    padded[np.arange(padded.shape[1]) < lengths[:, None]] = np.concatenate(trials, axis=0) if len(trials) else 0
+    return padded, lengths
+
+
+def padded_to_stacked(padded, lengths):
+    """
+    Convert a padded array and its lengths to a flat buffer and offsets.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    buffer = padded[np.arange(padded.shape[1]) < lengths[:, None]]
+    return buffer, offsets
+
+
+def _first_last(flags, group, starts, n_groups):
+    """
+    Local index of the first and last True flag of every group of a sorted, grouped array.
+
+    Returns the count of True flags and the first and last index relative to
+    starts (-1 where a group has no True flag).
+    """
+    positions = np.flatnonzero(flags)
+    counts = np.bincount(group[positions], minlength=n_groups)
+    first_in_positions = np.zeros(n_groups, dtype=np.int64)
+    np.cumsum(counts[:-1], out=first_in_positions[1:])
+    has_any = counts > 0
+    first = np.full(n_groups, -1, dtype=np.int64)
+    last = np.full(n_groups, -1, dtype=np.int64)
+    first[has_any] = positions[first_in_positions[has_any]] - starts[has_any]
+    last[has_any] = positions[first_in_positions[has_any] + counts[has_any] - 1] - starts[has_any]
+    return counts, first, last
+
+
+def v_t_g_batch(buffer, offsets, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs):
+    """
+    Function to calculate the differential and distance-based speed of many trials at once.
+
+    Gives the same results as v_t_g_compute and v_t_g_dist_compute for every
+    trial (up to floating point rounding), using a fixed number of vectorized
+    passes over the concatenated samples instead of one call per trial.
+
+    Parameters:
+    - buffer: Flat array of shape (n_samples, 3) with all trials concatenated (see stack_trials).
+    - offsets: Array of length n_trials + 1 with the start of every trial in buffer.
+    - Remaining parameters as in v_t_g_compute.
+
+    Returns a dictionary of arrays with one entry per trial. Trials where a
+    method cannot be computed get NaN as speed and False as validity.
+    """
+    # Position of all samples of all trials along the running direction, in one pass
+    Pos_all = project_run_axis(buffer, running_direction)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_trials = len(offsets) - 1
+    trial_of_sample = np.repeat(np.arange(n_trials), np.diff(offsets))
+
+    # Keep the samples between 0.5 m before Timing Gate 1 and 0.5 m after Timing Gate 2
+    start_rec = TIMING_GATE_1_pos + 0.5  # Extend upper limit
+    stop_rec = TIMING_GATE_2_pos - 0.5  # Extend lower limit
+    in_rec = (Pos_all >= stop_rec) & (Pos_all <= start_rec)
+    Pos_data = Pos_all[in_rec]
+    frame_of_pos = np.flatnonzero(in_rec)
+    trial_of_pos = trial_of_sample[in_rec]
+    n_filtered = np.bincount(trial_of_pos, minlength=n_trials)
+    pos_offsets = np.zeros(n_trials + 1, dtype=np.int64)
+    np.cumsum(n_filtered, out=pos_offsets[1:])
+    pos_starts = pos_offsets[:-1]
+
+    lower_bound = Target_speed * (1 - Tolerance / 100)
+    upper_bound = Target_speed * (1 + Tolerance / 100)
+
+    # Differential method: the mean of diff(Pos) / diff(frame) * fs with the last value repeated
+    same_trial = trial_of_pos[1:] == trial_of_pos[:-1]
+    steps = np.diff(Pos_data) / np.diff(frame_of_pos)
+    step_sums = np.bincount(trial_of_pos[:-1][same_trial], weights=steps[same_trial], minlength=n_trials)
+    mean_speed = np.full(n_trials, np.nan)
+    ok = n_filtered >= 2
+    last = pos_starts[ok] + n_filtered[ok] - 1
+    mean_speed[ok] = np.abs((step_sums[ok] + steps[last - 1]) * fs / n_filtered[ok])
+    is_valid = ok & (lower_bound <= mean_speed) & (mean_speed <= upper_bound)
+
+    # Distance-based method: first and last filtered sample strictly inside the gates
+    inside = (Pos_data > TIMING_GATE_2_pos) & (Pos_data < TIMING_GATE_1_pos)
+    n_inside, start_index, end_index = _first_last(inside, trial_of_pos, pos_starts, n_trials)
+    # Frame indices within each trial, so samples missing from the range do not shorten the time
+    has_inside = n_inside > 0
+    start_index[has_inside] = frame_of_pos[pos_starts[has_inside] + start_index[has_inside]] - offsets[:-1][has_inside]
+    end_index[has_inside] = frame_of_pos[pos_starts[has_inside] + end_index[has_inside]] - offsets[:-1][has_inside]
+    time_between_gates = np.where(n_inside > 0, (end_index - start_index) / fs, np.nan)
+    distance_between_gates = TIMING_GATE_1_pos - TIMING_GATE_2_pos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist_speed = distance_between_gates / time_between_gates
+    dist_is_valid = (n_inside > 0) & (lower_bound <= dist_speed) & (dist_speed <= upper_bound)
+
+    return {
+        'mean_speed': mean_speed,
+        'is_valid': is_valid,
+        'dist_speed': dist_speed,
+        'dist_is_valid': dist_is_valid,
+        'start_index': start_index,
+        'end_index': end_index,
+        'time_between_gates': time_between_gates,
+        'n_filtered': n_filtered,
+        'n_inside': n_inside,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound
+    }
+
+
+def v_t_g_batch_padded(padded, lengths, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs):
+    """
+    Same as v_t_g_batch for trials given as a padded (n_trials, max_frames, 3) array and their lengths.
+    """
+    buffer, offsets = padded_to_stacked(padded, lengths)
+    return v_t_g_batch(buffer, offsets, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs)
@@ -1,37 +1,106 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
-def v_t_g_dist(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, plot_figure):
+from gate_geometry import project_run_axis, gate_positions
+
+# Methods to time the timing gates: 'sample' uses the first and last sample between
+# the gates, 'linear' and 'cubic' interpolate the exact crossing time between samples
+CROSSING_METHODS = ('sample', 'linear', 'cubic')
+
+
+def find_gate_crossing(Pos_data, gate_pos, method='linear'):
     """
-    Function to calculate mean speed and validate based on distance based methods.
+    Find the fractional sample index where Pos_data first passes gate_pos.
+
+    The crossing is bracketed by a binary search on the running maximum of the
+    position along the running direction, which equals the position itself on
+    a monotonic run and ignores small backward movements caused by noise.
+
+    Parameters:
+    - Pos_data: Position in the running direction (m), one value per sample.
+    - gate_pos: Position of the timing gate (m).
+    - method: 'linear' for linear interpolation between the two bracketing
+      samples, or 'cubic' for a cubic through the four surrounding samples.
+
+    Returns the crossing as a fractional index into Pos_data.
+    """
+    if method not in ('linear', 'cubic'):
+        raise ValueError("Invalid crossing method. Use 'linear' or 'cubic'.")
+
+    # Flip the sign so the position increases along the running direction
+    direction = 1.0 if Pos_data[-1] >= Pos_data[0] else -1.0
+    q = direction * Pos_data
+    q_gate = direction * gate_pos
+    q_max = np.maximum.accumulate(q)
+
+    # First sample at or past the gate; the sample before it is still before the gate
+    i = np.searchsorted(q_max, q_gate, side='left')
+    if i == 0 or i == len(q):
+        raise ValueError(f"Timing gate at {gate_pos} m is not crossed within the data.")
+
+    # Linear interpolation between the bracketing samples
+    crossing = (i - 1) + (q_gate - q[i - 1]) / (q[i] - q[i - 1])
+
+    if method == 'cubic' and i >= 2 and i + 1 < len(q):
+        # Cubic through samples i-2 .. i+1, with x = 0 at sample i-1
+        coefficients = np.polyfit([-1.0, 0.0, 1.0, 2.0], q[i - 2:i + 2] - q_gate, 3)
+        roots = np.roots(coefficients)
+        roots = roots[np.isreal(roots)].real
+        roots = roots[(roots >= 0) & (roots <= 1)]
+        if len(roots) > 0:
+            # Keep the root closest to the linear estimate
+            crossing = (i - 1) + roots[np.argmin(np.abs(roots - (crossing - (i - 1))))]
+
+    return crossing
+
+
+def v_t_g_dist_compute(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, crossing='sample'):
     """
+    Function to calculate mean speed and validate based on distance based methods, without plotting.
+
+    crossing selects how the gates are timed (see CROSSING_METHODS). With
+    'sample' the time resolution is 1/fs; 'linear' and 'cubic' interpolate
+    the crossing times between samples.
+
+    The gates are timed with the frame numbers of the samples, so samples
+    that are missing from the range (e.g. gaps that could not be filled) do
+    not shorten the time between the gates.
+
+    Returns a dictionary with the speed, validity, bounds and the frame indices and
+    time between the timing gates (fractional indices for interpolated crossings).
+    """
+    if crossing not in CROSSING_METHODS:
+        raise ValueError(f"Invalid crossing method. Use one of {', '.join(CROSSING_METHODS)}.")
+
+    # Position of every sample along the running direction
+    Pos_all = project_run_axis(test_marker, running_direction)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
 
     # Adjust the range to include 0.5 meters before Timing Gate 1 and 0.5 meters after Timing Gate 2
     start_rec = TIMING_GATE_1_pos + 0.5  # Extend upper limit
     stop_rec = TIMING_GATE_2_pos - 0.5  # Extend lower limit
 
-    # Filter the test_marker data to be within start_rec and stop_rec
-    filtered_indices = np.where((test_marker[:, 1] >= stop_rec) & (test_marker[:, 1] <= start_rec))[0]
+    # Filter the position data to be within start_rec and stop_rec
+    filtered_indices = np.where((Pos_all >= stop_rec) & (Pos_all <= start_rec))[0]
     if len(filtered_indices) == 0:
         raise ValueError("No data points found within the timing gate range.")
-    test_marker = test_marker[filtered_indices]
+    Pos_data = Pos_all[filtered_indices]
 
-    # Extract position data for the running direction
-    if running_direction == 'y':
-        Pos_data = test_marker[:, 1]
-    elif running_direction == 'x':
-        Pos_data = test_marker[:, 0]
+    if crossing == 'sample':
+        # Find the first and last indices within the timing gates
+        index_within_range = np.where((Pos_data > TIMING_GATE_2_pos) & (Pos_data < TIMING_GATE_1_pos))[0]
+        if len(index_within_range) == 0:
+            raise ValueError("No data points found within the timing gate range for speed calculation.")
+        start_index = filtered_indices[index_within_range[0]]
+        end_index = filtered_indices[index_within_range[-1]]
     else:
-        raise ValueError("Invalid running direction. Use 'x' or 'y'.")
-
-    # Find the first and last indices within the timing gates
-    index_within_range = np.where((Pos_data > TIMING_GATE_2_pos) & (Pos_data < TIMING_GATE_1_pos))[0]
-    if len(index_within_range) == 0:
-        raise ValueError("No data points found within the timing gate range for speed calculation.")
+        # Interpolate the time at which each timing gate is crossed, mapped to frame indices
+        samples = np.arange(len(Pos_data))
+        gate_1_index = np.interp(find_gate_crossing(Pos_data, TIMING_GATE_1_pos, crossing), samples, filtered_indices)
+        gate_2_index = np.interp(find_gate_crossing(Pos_data, TIMING_GATE_2_pos, crossing), samples, filtered_indices)
+        start_index = min(gate_1_index, gate_2_index)
+        end_index = max(gate_1_index, gate_2_index)
 
     # Calculate the time between the timing gates
-    start_index = index_within_range[0]
-    end_index = index_within_range[-1]
     time_between_gates = (end_index - start_index) / fs  # Time in seconds
 
     # Calculate the distance between the timing gates
@@ -44,23 +113,61 @@ def v_t_g_dist(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_
     lower_bound = Target_speed * (1 - Tolerance / 100)
     upper_bound = Target_speed * (1 + Tolerance / 100)
 
-    # Always generate the plot
+    # Validate speed
+    is_valid = lower_bound <= speed <= upper_bound
+    return {
+        'speed': speed,
+        'is_valid': is_valid,
+        'start_index': start_index,
+        'end_index': end_index,
+        'time_between_gates': time_between_gates,
+        'Target_speed': Target_speed,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound
+    }
+
+
+def plot_v_t_g_dist(result, plot_figure=0, save_path=None):
+    """
+    Function to plot the speed computed by v_t_g_dist_compute.
+
+    Without save_path the figure is left open as the current figure so it can be saved by the caller.
+    """
+    from vtg_render import get_pyplot
+    plt = get_pyplot(plot_figure)
+
+    speed = result['speed']
+
     plt.figure(figsize=(10, 6))
     plt.axhline(speed, color='b', linewidth=2.5, label=f'Calculated Speed')
-    plt.axhline(Target_speed, color='g', linestyle=':', label=f'Target Speed')
-    plt.axhline(lower_bound, color='r', linestyle='--', label=f'Lower Bound')
-    plt.axhline(upper_bound, color='r', linestyle='--', label=f'Upper Bound')
-    plt.title(f'Speed: {speed:.2f} m/s - Valid: {"Yes" if lower_bound <= speed <= upper_bound else "No"}')
+    plt.axhline(result['Target_speed'], color='g', linestyle=':', label=f'Target Speed')
+    plt.axhline(result['lower_bound'], color='r', linestyle='--', label=f'Lower Bound')
+    plt.axhline(result['upper_bound'], color='r', linestyle='--', label=f'Upper Bound')
+    plt.title(f'Speed: {speed:.2f} m/s - Valid: {"Yes" if result["is_valid"] else "No"}')
     plt.xlabel('Time (s)')
     plt.ylabel('Speed (m/s)')
     plt.legend()
     plt.grid()
 
+    # Save the plot if a save path is provided
+    if save_path:
+        plt.savefig(save_path)
+
     # Show the plot only if plot_figure is set to 1
     if plot_figure == 1:
         plt.show(block=False)
         plt.close()
+    elif save_path:
+        plt.close()
 
-    # Validate speed
-    is_valid = lower_bound <= speed <= upper_bound
-    return speed, is_valid
\ No newline at end of file
+
+def v_t_g_dist(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, plot_figure, crossing='sample'):
+    """
+    Function to calculate mean speed and validate based on distance based methods.
+
+    Kept for backwards compatibility: always generates the plot. Use
+    v_t_g_dist_compute for the numeric result only.
+    """
+    result = v_t_g_dist_compute(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, crossing)
+    plot_v_t_g_dist(result, plot_figure)
+    return result['speed'], result['is_valid']
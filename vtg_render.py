@@ -0,0 +1,82 @@
+import os
+import sys
+
+
+def get_pyplot(plot_figure=0):
+    """
+    Import matplotlib.pyplot on first use.
+
+    When figures are not displayed (plot_figure != 1) and pyplot has not been
+    imported yet, the non-interactive Agg backend is selected, so plots can
+    be rendered in headless worker processes.
+    """
+    if plot_figure != 1 and 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_paths(filename, output_folder):
+    """
+    Return the paths of the velocity, distance-based speed and 3D plots of a trial.
+    """
+    name = os.path.splitext(filename)[0]
+    return [
+        os.path.join(output_folder, f"{name}_velocity_plot.png"),
+        os.path.join(output_folder, f"{name}_distance_plot.png"),
+        os.path.join(output_folder, f"{name}_3d_plot.png")
+    ]
+
+
+def render_trial(marker_to_use, speed_result, dist_result, filename, output_folder, params, metrics=None):
+    """
+    Save the velocity, distance-based speed and 3D plots of a single trial.
+
+    Parameters:
+    - marker_to_use: Midpoint trajectory of the trial in meters.
+    - speed_result: Result of v_t_g_compute.
+    - dist_result: Result of v_t_g_dist_compute.
+    - filename: Name of the trial file, used to name the plots.
+    - output_folder: Folder where the plots are saved.
+    - params: Dictionary with the processing parameters.
+    - metrics: Optional instrumentation.TrialMetrics timing the 2D plots ('savefig') and the 3D plot ('plot_3d').
+    """
+    from gate_geometry import running_direction_from_params
+    from instrumentation import TrialMetrics
+    from vtg_speed import plot_v_t_g
+    from vtg_dist import plot_v_t_g_dist
+    from vtg_3d import plot_3d
+
+    if metrics is None:
+        metrics = TrialMetrics(filename)
+    plot_figure = params['plot_figure']
+    velocity_plot_path, dist_plot_path, plot_3d_path = plot_paths(filename, output_folder)
+
+    with metrics.timer('savefig'):
+        # Save the velocity plot
+        plot_v_t_g(speed_result, plot_figure, save_path=velocity_plot_path)
+
+        # Save the distance-based speed plot
+        plot_v_t_g_dist(dist_result, plot_figure, save_path=dist_plot_path)
+
+    # Generate and save the 3D plot
+    if len(marker_to_use) == 0:
+        print(f"Warning: File {filename} is empty. Skipping 3D plot generation.")
+        return
+    try:
+        with metrics.timer('plot_3d'):
+            plot_3d(
+                marker_to_use,
+                running_direction_from_params(params),
+                params['TIMING_GATE_1_pos'],
+                params['TIMING_GATE_2_pos'],
+                params['Target_speed'],
+                params['Tolerance'],
+                params['fs'],
+                plot_figure,
+                save_path=plot_3d_path
+            )
+    except Exception as e:
+        metrics.failure('plot_3d', e)
+        print(f"Error generating 3D plot for {filename}: {e}")
@@ -1,59 +1,124 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
-def v_t_g(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, plot_figure):
+from derivatives import differentiate
+from gate_geometry import project_run_axis, gate_positions
+
+
+def v_t_g_compute(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs,
+                  derivative='diff', derivative_options=None):
     """
-    Function to calculate speed using numerical differential method.
+    Function to calculate speed using numerical differential method, without plotting.
+
+    derivative selects how the velocity is computed (see derivatives.DERIVATIVE_METHODS).
+    'diff' differentiates the samples within the range as before; the other
+    methods smooth the gap-free part of the trajectory around the range before
+    the range is selected, so the filters have no edge effects at the gates.
+    A missing (NaN) sample within the range raises a ValueError for them. derivative_options is passed
+    to derivatives.differentiate (e.g. {'cutoff': 10} for 'butterworth').
+
+    Returns a dictionary with the mean speed, validity, bounds, the velocity
+    of every sample within the timing gate range and the instantaneous speed
+    profile (speed_profile in m/s at time in s since the first frame).
     """
 
+    # Position of every sample along the running direction
+    Pos_all = project_run_axis(test_marker, running_direction)
+    TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+
     # Adjust the range to include 0.5 meters before Timing Gate 1 and 0.5 meters after Timing Gate 2
     start_rec = TIMING_GATE_1_pos + 0.5  # Extend upper limit
     stop_rec = TIMING_GATE_2_pos - 0.5  # Extend lower limit
 
-    # Filter the test_marker data to be within start_rec and stop_rec
-    filtered_indices = np.where((test_marker[:, 1] >= stop_rec) & (test_marker[:, 1] <= start_rec))[0]
+    # Filter the position data to be within start_rec and stop_rec
+    filtered_indices = np.where((Pos_all >= stop_rec) & (Pos_all <= start_rec))[0]
     if len(filtered_indices) == 0:
         raise ValueError("No data points found within the timing gate range.")
-    test_marker = test_marker[filtered_indices]
+    Pos_data = Pos_all[filtered_indices]
 
-    # Extract position data for the running direction
-    if running_direction == 'y':
-        Pos_data = test_marker[:, 1]
-    elif running_direction == 'x':
-        Pos_data = test_marker[:, 0]
+    # Calculate velocity; steps are divided by the number of frames between the samples,
+    # so samples missing from the range (unfilled gaps) do not shorten the time
+    if derivative == 'diff':
+        velocity = np.diff(Pos_data) / np.diff(filtered_indices) * fs
+        velocity = np.append(velocity, velocity[-1])  # Match size of velocity to position vector
     else:
-        raise ValueError("Invalid running direction. Use 'x' or 'y'.")
-
-    # Calculate velocity
-    velocity = np.diff(Pos_data) * fs
-    velocity = np.append(velocity, velocity[-1])  # Match size of velocity to position vector
+        # Smooth the contiguous segment of finite samples around the range; NaN samples
+        # (gaps that could not be filled) would spread through the filters
+        first, last = filtered_indices[0], filtered_indices[-1]
+        missing = np.flatnonzero(np.isnan(Pos_all))
+        if np.any((missing > first) & (missing < last)):
+            raise ValueError(f"Missing samples within the timing gate range; the '{derivative}' derivative needs a gap-free range "
+                             f"(fill the gaps with gap_fill or use derivative='diff').")
+        segment_start = missing[missing < first].max(initial=-1) + 1
+        segment_end = missing[missing > last].min(initial=len(Pos_all))
+        velocity = differentiate(Pos_all[segment_start:segment_end], fs, derivative, **(derivative_options or {}))
+        velocity = velocity[filtered_indices - segment_start]
 
     # Calculate mean speed and bounds
     mean_speed = np.abs(np.mean(velocity))  # Ensure mean speed is always positive
     lower_bound = Target_speed * (1 - Tolerance / 100)
     upper_bound = Target_speed * (1 + Tolerance / 100)
 
-    # Always generate the plot
+    # Validate speed
+    is_valid = lower_bound <= mean_speed <= upper_bound
+    return {
+        'mean_speed': mean_speed,
+        'is_valid': is_valid,
+        'velocity': velocity,
+        'speed_profile': np.abs(velocity),
+        'time': filtered_indices / fs,
+        'Target_speed': Target_speed,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound,
+        'fs': fs
+    }
+
+
+def plot_v_t_g(result, plot_figure=0, save_path=None):
+    """
+    Function to plot the velocity computed by v_t_g_compute.
+
+    Without save_path the figure is left open as the current figure so it can be saved by the caller.
+    """
+    from vtg_render import get_pyplot
+    plt = get_pyplot(plot_figure)
+
+    mean_speed = result['mean_speed']
+    velocity = result['velocity']
+    fs = result['fs']
+
     plt.figure(figsize=(10, 6))
 
     plt.axhline(mean_speed, color='b', linewidth=2.5, label=f'Mean Speed')
     plt.plot(np.abs(velocity), label='Velocity', linewidth=2, color='g')
-    plt.axhline(Target_speed, color='g', linestyle=':', label=f'Target Speed')
-    plt.axhline(lower_bound, color='r', linestyle='--', label=f'Lower Bound')
-    plt.axhline(upper_bound, color='r', linestyle='--', label=f'Upper Bound')
-    plt.title(f'Speed: {mean_speed:.2f} m/s - Valid: {"Yes" if lower_bound <= mean_speed <= upper_bound else "No"}')
+    plt.axhline(result['Target_speed'], color='g', linestyle=':', label=f'Target Speed')
+    plt.axhline(result['lower_bound'], color='r', linestyle='--', label=f'Lower Bound')
+    plt.axhline(result['upper_bound'], color='r', linestyle='--', label=f'Upper Bound')
+    plt.title(f'Speed: {mean_speed:.2f} m/s - Valid: {"Yes" if result["is_valid"] else "No"}')
     plt.xlabel('Time (s)')
-    time_axis = np.arange(len(velocity)) / fs
     plt.xticks(ticks=np.linspace(0, len(velocity), num=5), labels=np.round(np.linspace(0, len(velocity) / fs, num=5), 2))
     plt.ylabel('Velocity (m/s)')
     plt.legend()
     plt.grid()
 
+    # Save the plot if a save path is provided
+    if save_path:
+        plt.savefig(save_path)
+
     # Show the plot only if plot_figure is set to 1
     if plot_figure == 1:
         plt.show(block=False)
         plt.close()
+    elif save_path:
+        plt.close()
 
-    # Validate speed
-    is_valid = lower_bound <= mean_speed <= upper_bound
-    return mean_speed, is_valid
\ No newline at end of file
+
+def v_t_g(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs, plot_figure):
+    """
+    Function to calculate speed using numerical differential method.
+
+    Kept for backwards compatibility: always generates the plot. Use
+    v_t_g_compute for the numeric result only.
+    """
+    result = v_t_g_compute(test_marker, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs)
+    plot_v_t_g(result, plot_figure)
+    return result['mean_speed'], result['is_valid']
@@ -0,0 +1,178 @@
+import argparse
+import time
+
+import numpy as np
+
+from gate_geometry import project_run_axis, gate_positions
+from qtm_reader import iter_qtm_tsv
+
+
+class StreamingSpeedEstimator:
+    """
+    Incremental speed estimator for live capture feedback.
+
+    Frames of the midpoint trajectory are pushed one at a time or in small
+    chunks. The estimator detects the crossings of Timing Gate 1 and Timing
+    Gate 2 as they happen (interpolated between samples) and reports the
+    speed and verdict of a pass on the first frame past Timing Gate 2.
+    Only a fixed number of values is kept, so memory use does not depend on
+    the length of the recording.
+
+    Every reported pass contains:
+    - speed / is_valid: Speed between the gates (as v_t_g_dist_compute with crossing='linear').
+    - mean_speed / mean_is_valid: Differential mean speed (as v_t_g_compute) over
+      the samples from 0.5 m before Timing Gate 1 up to Timing Gate 2.
+    - gate_1_time / gate_2_time: Crossing times in seconds since the first frame.
+    - frame: Index of the frame at which the pass was reported.
+    """
+
+    def __init__(self, running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos, Target_speed, Tolerance, fs):
+        # Validate the running direction; samples are projected per chunk in push
+        project_run_axis(np.zeros((1, 3)), running_direction)
+        self.running_direction = running_direction
+        TIMING_GATE_1_pos, TIMING_GATE_2_pos = gate_positions(running_direction, TIMING_GATE_1_pos, TIMING_GATE_2_pos)
+        self.gate_1 = TIMING_GATE_1_pos
+        self.gate_2 = TIMING_GATE_2_pos
+        self.fs = fs
+        self.Target_speed = Target_speed
+        self.lower_bound = Target_speed * (1 - Tolerance / 100)
+        self.upper_bound = Target_speed * (1 + Tolerance / 100)
+        # Range of the differential method: 0.5 m before Timing Gate 1 to 0.5 m after Timing Gate 2
+        self.start_rec = TIMING_GATE_1_pos + 0.5
+        self.stop_rec = TIMING_GATE_2_pos - 0.5
+        self.frame = 0
+        self.previous = None  # (frame, position) of the last valid sample
+        self.gate_1_index = None  # Fractional frame index of the Timing Gate 1 crossing
+        self._reset_window()
+
+    def _reset_window(self):
+        # Sum of the steps per frame within the range, the last step, the last (frame, position) and the count
+        self.step_sum = 0.0
+        self.last_step = None
+        self.last = None
+        self.count = 0
+
+    def _crossing(self, gate, frame, position):
+        """
+        Fractional frame index where the line from the previous sample to this one crosses gate, or None.
+        """
+        previous_frame, previous_position = self.previous
+        if (previous_position >= gate) == (position >= gate):
+            return None
+        fraction = (gate - previous_position) / (position - previous_position)
+        return previous_frame + fraction * (frame - previous_frame)
+
+    def _update(self, position):
+        frame = self.frame
+        self.frame += 1
+        if np.isnan(position):
+            return None
+
+        # Samples within the range of the differential method (as v_t_g_compute)
+        if self.stop_rec <= position <= self.start_rec:
+            if self.last is not None:
+                # Divide by the frames between the samples, so missing samples do not shorten the time
+                self.last_step = (position - self.last[1]) / (frame - self.last[0])
+                self.step_sum += self.last_step
+            self.last = (frame, position)
+            self.count += 1
+        elif self.gate_1_index is None:
+            self._reset_window()
+
+        result = None
+        if self.previous is not None:
+            gate_1_index = self._crossing(self.gate_1, frame, position)
+            if gate_1_index is not None:
+                # (Re)start a pass when Timing Gate 1 is crossed
+                self.gate_1_index = gate_1_index
+            elif self.gate_1_index is not None:
+                gate_2_index = self._crossing(self.gate_2, frame, position)
+                if gate_2_index is not None:
+                    result = self._result(gate_2_index, frame)
+                    self.gate_1_index = None
+                    self._reset_window()
+        self.previous = (frame, position)
+        return result
+
+    def _result(self, gate_2_index, frame):
+        time_between_gates = (gate_2_index - self.gate_1_index) / self.fs
+        speed = abs(self.gate_1 - self.gate_2) / time_between_gates
+        if self.count >= 2:
+            mean_speed = abs((self.step_sum + self.last_step) * self.fs / self.count)
+        else:
+            mean_speed = np.nan
+        return {
+            'speed': speed,
+            'is_valid': self.lower_bound <= speed <= self.upper_bound,
+            'mean_speed': mean_speed,
+            'mean_is_valid': bool(self.lower_bound <= mean_speed <= self.upper_bound),
+            'gate_1_time': self.gate_1_index / self.fs,
+            'gate_2_time': gate_2_index / self.fs,
+            'frame': frame
+        }
+
+    def push(self, samples):
+        """
+        Push one frame (shape (3,)) or a chunk of frames (shape (n, 3)) of the
+        midpoint trajectory in meters. NaN samples are treated as missing.
+
+        Returns a list with the passes completed within these frames.
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        if samples.ndim == 1:
+            samples = samples[None, :]
+        # Position along the running direction of the whole chunk at once
+        positions = np.where(np.isnan(samples).any(axis=1), np.nan, project_run_axis(samples, self.running_direction))
+        results = []
+        for position in positions.tolist():
+            result = self._update(position)
+            if result is not None:
+                results.append(result)
+        return results
+
+
+def replay_tsv(file_path, markers=('SIPS_left', 'SIPS_right'), chunk_size=1, realtime=False):
+    """
+    Replay a QTM TSV export as a stream of midpoint chunks.
+
+    Parameters:
+    - file_path: Path to the TSV file.
+    - markers: Markers used to compute the midpoint trajectory.
+    - chunk_size: Number of frames per chunk.
+    - realtime: Set to True to wait 1/FREQUENCY seconds per frame, as a live capture.
+
+    Yields arrays of shape (n, 3) with the midpoint in meters; frames where
+    a marker is missing (0.000 in the export) are NaN.
+    """
+    chunks = iter_qtm_tsv(file_path, list(markers), chunk_size)
+    header = next(chunks)
+    frame_time = 1 / header.get('FREQUENCY', 200)
+    start = time.perf_counter()
+    n_frames = 0
+    for chunk in chunks:
+        midpoint = chunk.mean(axis=1) / 1000
+        midpoint[np.all(chunk == 0, axis=2).any(axis=1)] = np.nan
+        n_frames += len(chunk)
+        if realtime:
+            time.sleep(max(0.0, start + n_frames * frame_time - time.perf_counter()))
+        yield midpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a QTM TSV export and report the speed of every pass through the timing gates.")
+    parser.add_argument('file', help="TSV file to replay")
+    parser.add_argument('--running-direction', default='y', choices=['x', 'y', '-x', '-y'])
+    parser.add_argument('--gate-1', type=float, default=1.7, help="Position of Timing Gate 1 (m)")
+    parser.add_argument('--gate-2', type=float, default=-0.5, help="Position of Timing Gate 2 (m)")
+    parser.add_argument('--target-speed', type=float, default=3.5, help="Target speed (m/s)")
+    parser.add_argument('--tolerance', type=float, default=10, help="Tolerance in percentage (+/-)")
+    parser.add_argument('--fs', type=float, default=200, help="Sampling frequency (Hz)")
+    parser.add_argument('--chunk-size', type=int, default=1, help="Frames per chunk")
+    parser.add_argument('--realtime', action='store_true', help="Replay at the capture rate")
+    args = parser.parse_args()
+
+    estimator = StreamingSpeedEstimator(args.running_direction, args.gate_1, args.gate_2, args.target_speed, args.tolerance, args.fs)
+    for chunk in replay_tsv(args.file, chunk_size=args.chunk_size, realtime=args.realtime):
+        for result in estimator.push(chunk):
+            print(f"Frame {result['frame']}: Speed {result['speed']:.2f} m/s - Valid: {'Yes' if result['is_valid'] else 'No'} "
+                  f"(mean speed {result['mean_speed']:.2f} m/s)")